@@ -1,10 +1,18 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from app.services.order_service import get_order_status
 from app.services.product_service import get_product_stock
-from rag.retrieval.vector_store import PineconeVectorStore
+from rag.retrieval.vector_store import PineconeVectorStore, InMemoryVectorStore
+from rag.retrieval.ivf_store import IVFVectorStore, IVF_FILE
+from rag.retrieval.sharded_store import ShardedVectorStore
 from rag.retrieval.retriever import Retriever
+from rag.retrieval.bm25_index import BM25Index
+from rag.retrieval.query_cache import QueryCache
+from rag.augmentation.augmenter import RAGAugmenter
+from rag.augmentation.compressor import ExtractiveCompressor
 from rag.agents.agentic_controller import AgenticRAGController
+from rag.agents.semantic_cache import SemanticAnswerCache
 from langchain_openai import OpenAIEmbeddings
+import json
 import os
 from dotenv import load_dotenv
 from app.services.return_refund_service import (
@@ -38,10 +46,46 @@ def product_stock(product_name):
 
 # === Agentic RAG Endpoint  ===
 # Initialize once at startup
-vector_store = PineconeVectorStore(index_name="ecommerce-agentic-rag")
+# A local snapshot (see InMemoryVectorStore.save) is memory-mapped, so every worker shares one page-cached copy.
+RAG_INDEX_PATH = os.getenv("RAG_INDEX_PATH")
+if RAG_INDEX_PATH and os.path.isdir(RAG_INDEX_PATH):
+    # ivf.npz is written by `python -m rag.ingestion.pipeline --index-path ... --ivf` once the snapshot is large enough
+    if os.path.exists(os.path.join(RAG_INDEX_PATH, IVF_FILE)):
+        vector_store = IVFVectorStore.load(RAG_INDEX_PATH, mmap=True, nprobe=int(os.getenv("RAG_IVF_NPROBE", 8)))
+    else:
+        vector_store = InMemoryVectorStore.load(RAG_INDEX_PATH, mmap=True)
+        # Exact search over large snapshots can be spread across worker processes
+        if os.getenv("RAG_SEARCH_SHARDS"):
+            vector_store = ShardedVectorStore(vector_store, n_shards=int(os.getenv("RAG_SEARCH_SHARDS")))
+else:
+    vector_store = PineconeVectorStore(index_name="ecommerce-agentic-rag")
 embedder = OpenAIEmbeddings(model="text-embedding-3-large", api_key=os.getenv("OPENAI_API_KEY"))
-retriever = Retriever(vector_store, embedder)
-rag_controller = AgenticRAGController(retriever)  # Full agentic logic
+# BM25 index written at ingestion time by rag/ingestion/pipeline.py; enables hybrid retrieval
+RAG_KEYWORD_INDEX_PATH = os.getenv("RAG_KEYWORD_INDEX_PATH", "data/index/bm25")
+keyword_index = BM25Index.load(RAG_KEYWORD_INDEX_PATH) if os.path.isdir(RAG_KEYWORD_INDEX_PATH) else None
+# Recurring support questions skip HyDE generation and query embedding; shared across workers via Redis if configured
+query_cache = QueryCache(ttl=float(os.getenv("RAG_QUERY_CACHE_TTL", 3600)), redis_url=os.getenv("RAG_QUERY_CACHE_REDIS_URL"))
+retriever = Retriever(vector_store, embedder, keyword_index=keyword_index, query_cache=query_cache)
+# Context is packed into a token budget: deduplicated, best passages first, tail cut at a sentence boundary
+augmenter = RAGAugmenter(max_context_tokens=int(os.getenv("RAG_CONTEXT_TOKENS", 2000)))
+# Only the most query-relevant retrieved sentences reach the LLM; RAG_COMPRESS_SENTENCES=0 disables compression
+RAG_COMPRESS_SENTENCES = int(os.getenv("RAG_COMPRESS_SENTENCES", 10))
+compressor = ExtractiveCompressor(max_sentences=RAG_COMPRESS_SENTENCES) if RAG_COMPRESS_SENTENCES > 0 else None
+# Paraphrases of earlier questions are answered from memory; dropped whenever ingestion rewrites the manifest
+RAG_MANIFEST_PATH = os.getenv("RAG_MANIFEST_PATH", "data/index/manifest.json")
+
+
+def index_version() -> str:
+    return str(os.stat(RAG_MANIFEST_PATH).st_mtime_ns) if os.path.exists(RAG_MANIFEST_PATH) else ""
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", 0.92)),
+    ttl=float(os.getenv("RAG_ANSWER_CACHE_TTL", 3600)),
+    version_fn=index_version
+)
+rag_controller = AgenticRAGController(retriever, augmenter=augmenter, compressor=compressor,
+                                      answer_cache=answer_cache)  # Full agentic logic
 
 
 @api_blueprint.route('/rag/query', methods=['POST'])
@@ -55,18 +99,52 @@ def rag_query():
 
     try:
         # Use Agentic Controller (includes self-correction RAG + tool calling)
-        result = rag_controller.query(query)
+        # Optional metadata scope, e.g. {"product_id": "PROD-001"} or {"source": {"$in": [...]}}
+        result = rag_controller.query(query, filter=data.get("filter"))
 
         return jsonify({
             "answer": result["answer"],
             "sources": result["sources"],
             "confidence": result["confidence"],
+            "context_tokens": result.get("context_tokens"),
+            "compression": result.get("compression"),
             "tool_calls": result.get("tool_calls", []),
             "hops": result.get("hops", 1),
-            "retrieval_retries": result.get("retrieval_retries", 0)
+            "retrieval_retries": result.get("retrieval_retries", 0),
+            "cached": result.get("cached", False)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@api_blueprint.route('/rag/query/stream', methods=['POST'])
+def rag_query_stream():
+    """
+    Same request as /rag/query, answered as server-sent events: "token" events
+    while the answer is generated, "tool_call" events, then a final "done" event
+    with answer, sources, confidence and tool calls.
+    """
+    data = request.get_json()
+    if not data or "query" not in data:
+        return jsonify({"error": "Query is required"}), 400
+
+    def events():
+        try:
+            for event in rag_controller.query_stream(data["query"], filter=data.get("filter")):
+                name = event.pop("type")
+                yield f"event: {name}\ndata: {json.dumps(event, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    # No proxy buffering, so each token reaches the client as soon as it is generated
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@api_blueprint.route('/rag/cache/stats', methods=['GET'])
+def rag_cache_stats():
+    """Hit rates of the HyDE / query embedding cache and of the semantic answer cache"""
+    return jsonify({**query_cache.stats(), "answers": answer_cache.stats()})
     
 
 # === RAG Evaluation End-points ===
@@ -3,25 +3,72 @@ Agentic RAG Controller: Full pipeline with:
 - Self-correction (low confidence)
 - Tool calling (multi-hop)
 - RAG augmentation
+- Token streaming (query_stream)
+- asyncio path with concurrent tool calls (aquery)
+- Semantic answer cache for paraphrased questions
 """
 from rag.retrieval.retriever import Retriever
 from rag.augmentation.augmenter import RAGAugmenter
-from rag.generation.generator import RAGGenerator
-from typing import Dict, Any, List
+from rag.augmentation.compressor import ExtractiveCompressor
+from rag.generation.generator import AsyncRAGGenerator, RAGGenerator
+from rag.agents.semantic_cache import SemanticAnswerCache
+from typing import Dict, Any, Generator, Iterator, List, Optional, Tuple
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 class AgenticRAGController:
-    def __init__(self, retriever: Retriever):
+    def __init__(self, retriever: Retriever, augmenter: Optional[RAGAugmenter] = None,
+                 compressor: Optional[ExtractiveCompressor] = None, answer_cache: Optional[SemanticAnswerCache] = None):
         self.retriever = retriever
-        self.augmenter = RAGAugmenter()
+        self.augmenter = augmenter or RAGAugmenter()
+        self.compressor = compressor  # optional extractive compression of retrieved chunks before augmentation
+        self.answer_cache = answer_cache  # answers to earlier, similar questions (query embedding is reused by retrieval)
         self.generator = RAGGenerator()
+        self.async_generator = AsyncRAGGenerator()
         self.max_hops = 3
         self.max_retries = 2
         self.confidence_threshold = 0.6
 
-    def query(self, user_query: str) -> Dict[str, Any]:
+    def _build_context(self, query: str, filter: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Optional[Dict[str, Any]]]:
+        # Retrieve (HyDE runs alongside direct retrieval, off the critical path)
+        docs = self.retriever.retrieve(
+            query, top_k=5, use_hyde=True, use_mmr=True, filter=filter, concurrent_hyde=True
+        )
+        return (docs, *self._augment(query, docs))
+
+    async def _abuild_context(self, query: str, filter: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Optional[Dict[str, Any]]]:
+        docs = await self.retriever.aretrieve(query, top_k=5, use_hyde=True, use_mmr=True, filter=filter)
+        # Compression and token counting are CPU work: keep them off the event loop
+        return (docs, *await asyncio.to_thread(self._augment, query, docs))
+
+    def _augment(self, query: str, docs: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        # Compress (keep only query-relevant sentences) and augment
+        context_docs, compression = docs, None
+        if self.compressor is not None:
+            context_docs, compression = self.compressor.compress(query, docs)
+        return self.augmenter.augment(query, context_docs), compression
+
+    def query(self, user_query: str, filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """`filter` scopes retrieval by chunk metadata, e.g. {"product_id": "PROD-001"}."""
+        if self.answer_cache is None:
+            return self._query(user_query, filter)
+        embedding = self.retriever.embed_query(user_query)
+        cached = self.answer_cache.lookup(embedding, filter)
+        if cached is not None:
+            return cached
+        result = self._query(user_query, filter)
+        self.answer_cache.store(embedding, result, filter, min_confidence=self.confidence_threshold)
+        return result
+
+    def _query_steps(self, user_query: str) -> Generator[Tuple[str, Any], Any, Dict[str, Any]]:
+        """
+        The hop/retry loop shared by `_query` and `_aquery`, without doing any
+        I/O itself: it yields ("context", query) to be sent back
+        (docs, augmented, compression), and ("generate", messages) to be sent
+        back the generator's result, and returns the final answer.
+        """
         messages: List[Dict] = [{"role": "user", "content": user_query}]
         tool_calls_history = []
         current_query = user_query
@@ -29,17 +76,12 @@ class AgenticRAGController:
         for hop in range(self.max_hops):
             retry_count = 0
             while retry_count <= self.max_retries:
-                # Step 1: Retrieve
-                docs = self.retriever.retrieve(
-                    current_query, top_k=5, use_hyde=True, use_mmr=True
-                )
-
-                # Step 2: Augment
-                augmented = self.augmenter.augment(current_query, docs)
+                # Steps 1-2: Retrieve, compress and augment
+                docs, augmented, compression = yield "context", current_query
                 messages[0]["content"] = augmented["prompt"]
 
                 # Step 3: Generate with tool calling
-                result = self.generator.generate(messages, use_tools=True)
+                result = yield "generate", messages
 
                 # Step 4: Tool Calling
                 if result.get("tool_calls"):
@@ -54,7 +96,7 @@ class AgenticRAGController:
                     logger.info(f"Low confidence ({confidence:.2f}), retry {retry_count + 1}")
                     current_query = (
                         f"Rephrase and improve: '{user_query}' "
-                        f"using partial context: {docs[0].get('text', '')[:200]}"
+                        f"using partial context: {(docs[0].get('text', '') if docs else '')[:200]}"
                     )
                     retry_count += 1
                     continue
@@ -64,6 +106,8 @@ class AgenticRAGController:
                         "answer": result["response"],
                         "sources": augmented["metadata"]["sources"],
                         "confidence": confidence,
+                        "context_tokens": augmented["metadata"]["context_tokens"],
+                        "compression": compression,
                         "tool_calls": tool_calls_history,
                         "hops": hop + 1,
                         "retrieval_retries": retry_count,
@@ -75,4 +119,99 @@ class AgenticRAGController:
             "confidence": 0.0,
             "tool_calls": tool_calls_history,
             "hops": self.max_hops
-        }
\ No newline at end of file
+        }
+
+    def _query(self, user_query: str, filter: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        steps = self._query_steps(user_query)
+        try:
+            step, arg = next(steps)
+            while True:
+                if step == "context":
+                    reply = self._build_context(arg, filter)
+                else:
+                    reply = self.generator.generate(arg, use_tools=True)
+                step, arg = steps.send(reply)
+        except StopIteration as done:
+            return done.value
+
+    async def aquery(self, user_query: str, filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        `query` for asyncio callers: retrieval and generation are awaited
+        (Retriever.aretrieve, AsyncRAGGenerator) instead of blocking a worker
+        thread, and the tool calls of one model turn run concurrently.
+        """
+        if self.answer_cache is None:
+            return await self._aquery(user_query, filter)
+        embedding = await self.retriever.aembed_query(user_query)
+        cached = self.answer_cache.lookup(embedding, filter)
+        if cached is not None:
+            return cached
+        result = await self._aquery(user_query, filter)
+        self.answer_cache.store(embedding, result, filter, min_confidence=self.confidence_threshold)
+        return result
+
+    async def _aquery(self, user_query: str, filter: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        steps = self._query_steps(user_query)
+        try:
+            step, arg = next(steps)
+            while True:
+                if step == "context":
+                    reply = await self._abuild_context(arg, filter)
+                else:
+                    reply = await self.async_generator.generate(arg, use_tools=True)
+                step, arg = steps.send(reply)
+        except StopIteration as done:
+            return done.value
+
+    def query_stream(self, user_query: str, filter: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of `query`: yields the generator's "token" and
+        "tool_call" events as they arrive, then a "done" event carrying the
+        answer, sources, confidence and tool calls.
+
+        Tokens cannot be taken back once sent, so the low-confidence retries
+        happen before generation (confidence comes from retrieval, not from the
+        answer), and tool results are answered by the generator's streamed
+        follow-up completion instead of a new retrieval hop. A cached answer
+        is sent as a single "token" event.
+        """
+        embedding = None
+        if self.answer_cache is not None:
+            embedding = self.retriever.embed_query(user_query)
+            cached = self.answer_cache.lookup(embedding, filter)
+            if cached is not None:
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "done", **cached}
+                return
+
+        current_query = user_query
+        for retry_count in range(self.max_retries + 1):
+            docs, augmented, compression = self._build_context(current_query, filter)
+            confidence = augmented["metadata"]["confidence"]
+            if confidence >= self.confidence_threshold or retry_count == self.max_retries:
+                break
+            logger.info(f"Low confidence ({confidence:.2f}), retry {retry_count + 1}")
+            current_query = (
+                f"Rephrase and improve: '{user_query}' "
+                f"using partial context: {(docs[0].get('text', '') if docs else '')[:200]}"
+            )
+
+        messages: List[Dict] = [{"role": "user", "content": augmented["prompt"]}]
+        for event in self.generator.generate_stream(messages, use_tools=True):
+            if event["type"] != "done":
+                yield event
+                continue
+            result = {
+                "answer": event["response"],
+                "sources": augmented["metadata"]["sources"],
+                "confidence": confidence,
+                "context_tokens": augmented["metadata"]["context_tokens"],
+                "compression": compression,
+                "tool_calls": event["tool_calls"],
+                "hops": 1,
+                "retrieval_retries": retry_count,
+                **({"error": event["error"]} if "error" in event else {})
+            }
+            if self.answer_cache is not None:
+                self.answer_cache.store(embedding, result, filter, min_confidence=self.confidence_threshold)
+            yield {"type": "done", **result}
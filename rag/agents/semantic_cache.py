@@ -0,0 +1,142 @@
+"""
+Semantic answer cache: serve a stored answer to a paraphrase of an earlier question.
+"""
+from typing import Any, Callable, Dict, List, Optional
+import json
+import threading
+import time
+import numpy as np
+
+# Controller result fields worth serving again; retrieved_docs and the like are not kept
+CACHED_FIELDS = ("answer", "sources", "confidence", "context_tokens", "compression", "tool_calls", "hops", "retrieval_retries")
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by query embedding in an in-process matrix (one float32 row
+    per entry, rows normalized), so a lookup is a single matrix-vector product
+    plus an argmax. A query is a hit when its cosine similarity to a live
+    entry with the same retrieval filter is at least `threshold`.
+
+    `dimensions` keeps only the leading embedding components (renormalized)
+    for the cache matrix; text-embedding-3 embeddings are trained to be
+    shortened this way, and 256 components keep lookups well under a
+    millisecond at `max_entries`. Set it to None for other embedders.
+
+    Entries expire after `ttl` seconds; when full, an expired or else the
+    oldest row is overwritten. `version_fn` returns the current index version
+    (e.g. the ingestion manifest's mtime) and is checked on every call: when
+    it changes, the whole cache is dropped, because answers may cite chunks
+    that no longer exist. Answers that used tool calls (order status, stock
+    -- user-specific), that carry no sources or that score below the
+    caller's `min_confidence` are never stored, and only CACHED_FIELDS are kept.
+    """
+    def __init__(self, threshold: float = 0.92, ttl: float = 3600.0, max_entries: int = 10000,
+                 dimensions: Optional[int] = 256, version_fn: Optional[Callable[[], str]] = None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.version_fn = version_fn
+        self._version = version_fn() if version_fn is not None else None
+        self._matrix: Optional[np.ndarray] = None  # allocated on first store, once the dimension is known
+        self._expires = np.zeros(max_entries, dtype=np.float64)  # 0.0 = empty row
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._scopes = np.full(max_entries, -1, dtype=np.int32)
+        self._scope_ids: Dict[str, int] = {}
+        self._answers: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._size = 0  # rows ever used (high-water mark)
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "stores": 0, "not_cacheable": 0, "invalidations": 0, "lookup_seconds": 0.0}
+
+    def _vector(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)[:self.dimensions]
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    @staticmethod
+    def _scope_key(filter: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(filter or {}, sort_keys=True, default=str)
+
+    def _check_version(self):
+        # Caller holds the lock
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._clear()
+            self._version = version
+            self._metrics["invalidations"] += 1
+
+    def lookup(self, embedding: List[float], filter: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached answer (with "cached" and "cache_similarity") for a similar earlier query, or None."""
+        start = time.perf_counter()
+        vector = self._vector(embedding)
+        with self._lock:
+            self._check_version()
+            answer, similarity = None, 0.0
+            scope = self._scope_ids.get(self._scope_key(filter))
+            if scope is not None and self._size:
+                similarities = self._matrix[:self._size] @ vector
+                live = (self._expires[:self._size] > time.time()) & (self._scopes[:self._size] == scope)
+                similarities[~live] = -np.inf
+                row = int(np.argmax(similarities))
+                if similarities[row] >= self.threshold:
+                    answer, similarity = self._answers[row], float(similarities[row])
+            self._metrics["hits" if answer is not None else "misses"] += 1
+            self._metrics["lookup_seconds"] += time.perf_counter() - start
+        if answer is None:
+            return None
+        return {**answer, "cached": True, "cache_similarity": round(similarity, 4)}
+
+    def store(self, embedding: List[float], answer: Dict[str, Any], filter: Optional[Dict[str, Any]] = None,
+              min_confidence: float = 0.0) -> bool:
+        """Cache `answer` (a controller result) unless it used tools or is not a confident, grounded answer."""
+        if (answer.get("tool_calls") or not answer.get("sources") or answer.get("error")
+                or answer.get("confidence", 0.0) < min_confidence):
+            with self._lock:
+                self._metrics["not_cacheable"] += 1
+            return False
+        vector = self._vector(embedding)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            free = np.flatnonzero(self._expires[:self._size] <= now)
+            if len(free):
+                row = int(free[0])
+            elif self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._stored_at))
+            scope_key = self._scope_key(filter)
+            scope = self._scope_ids.setdefault(scope_key, len(self._scope_ids))
+            self._matrix[row] = vector
+            self._expires[row] = now + self.ttl
+            self._stored_at[row] = now
+            self._scopes[row] = scope
+            self._answers[row] = {key: answer[key] for key in CACHED_FIELDS if key in answer}
+            self._metrics["stores"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            entries = int(np.count_nonzero(self._expires[:self._size] > time.time()))
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        metrics["avg_lookup_ms"] = round(1000 * metrics.pop("lookup_seconds") / lookups, 4) if lookups else 0.0
+        return {"entries": entries, "index_version": self._version, **metrics}
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._expires[:] = 0.0
+        self._stored_at[:] = 0.0
+        self._scopes[:] = -1
+        self._scope_ids.clear()
+        self._answers = [None] * self.max_entries
+        self._size = 0
@@ -2,16 +2,18 @@
 Tool Registry: Define available tools with schema for LLM.
 """
 from typing import Dict, Any, Callable
-from api.app.services.order_service import get_order_status
-from api.app.services.product_service import get_product_stock
+import asyncio
+import importlib
 import json
+import sys
 
 class Tool:
-    def __init__(self, name: str, func: Callable, description: str, parameters: Dict):
+    def __init__(self, name: str, func: Callable, description: str, parameters: Dict, timeout: float = 10.0):
         self.name = name
         self.func = func
         self.description = description
         self.parameters = parameters
+        self.timeout = timeout  # seconds `aexecute` waits before giving up on the call
 
     def to_schema(self) -> Dict:
         return {
@@ -26,11 +28,32 @@ class Tool:
     def execute(self, args: Dict) -> Any:
         return self.func(**args)
 
+    async def aexecute(self, args: Dict) -> Any:
+        """Run the tool without blocking the event loop (sync functions go to a worker thread), within `timeout`."""
+        if asyncio.iscoroutinefunction(self.func):
+            call = self.func(**args)
+        else:
+            call = asyncio.to_thread(self.func, **args)
+        return await asyncio.wait_for(call, timeout=self.timeout)
+
+def _service(module: str, name: str) -> Callable:
+    """
+    api.app.services.<module>.<name>, imported on first call: importing
+    api.app builds the Flask app and its retrieval stack, which merely
+    loading the registry (or the generator) must not do.
+    """
+    def call(**kwargs):
+        # Inside the running API the services are already loaded as app.services.*
+        loaded = sys.modules.get(f"app.services.{module}") or importlib.import_module(f"api.app.services.{module}")
+        return getattr(loaded, name)(**kwargs)
+    call.__name__ = name
+    return call
+
 # Define Tools
 TOOLS = [
     Tool(
         name="get_order_status",
-        func=get_order_status,
+        func=_service("order_service", "get_order_status"),
         description="Get current status of an order by order_id. Use when user asks about order tracking.",
         parameters={
             "type": "object",
@@ -42,7 +65,7 @@ TOOLS = [
     ),
     Tool(
         name="check_product_stock",
-        func=get_product_stock,
+        func=_service("product_service", "get_product_stock"),
         description="Check if a product is in stock by name. Returns stock count and restock date.",
         parameters={
             "type": "object",
@@ -1,25 +1,56 @@
 """
 Augmenter: Combines query + retrieved docs into LLM-ready prompt.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import json
+import re
+from rag.ingestion.chunker import DEFAULT_ENCODING, count_tokens
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+")
+# Retrieval scores in order of preference: reranker, then RRF fusion, then raw similarity
+_RANK_KEYS = ("rerank_score", "fusion_score", "score")
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
 
 class RAGAugmenter:
-    def __init__(self):
+    """
+    With `max_context_tokens` set, `augment` packs the context into that many
+    tokens (counted with tiktoken, see rag.ingestion.chunker.count_tokens):
+    docs are ordered by score, a passage whose word shingles are at least
+    `overlap_threshold` contained in an already packed passage is dropped
+    (chunk overlap, repeated boilerplate), and the passage that no longer fits
+    is cut at a sentence boundary. Without a budget every doc is included as-is.
+    Either way the metadata reports "context_tokens".
+    """
+    def __init__(self, max_context_tokens: Optional[int] = None, overlap_threshold: float = 0.8,
+                 encoding_name: str = DEFAULT_ENCODING):
         self.system_prompt = (
             "You are an expert e-commerce customer support agent. "
             "Use ONLY the provided context to answer user's queries. "
             "If unsure, say 'I don't have enough information.' "
             "Cite sources using [Source: X] format."
         )
+        self.max_context_tokens = max_context_tokens
+        self.overlap_threshold = overlap_threshold
+        self.encoding_name = encoding_name
 
-    def augment(self, query: str, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def augment(self, query: str, docs: List[Dict[str, Any]], max_context_tokens: Optional[int] = None) -> Dict[str, Any]:
         if not docs:
             return {
                 "prompt": f"{self.system_prompt}\n\nUser: {query}\nAssistant: I don't have enough information to answer this.",
-                "metadata": {"sources": [], "confidence": 0.0}
+                "metadata": {"sources": [], "confidence": 0.0, "context_tokens": 0}
             }
 
+        budget = max_context_tokens if max_context_tokens is not None else self.max_context_tokens
+        stats = {}
+        if budget is not None:
+            docs, stats = self.pack(docs, budget)
+
         # Format context with source + text
         context_blocks = []
         total_score = 0.0
@@ -47,7 +78,54 @@ Assistant:"""
                 {"source": d["metadata"].get("source"), "score": d.get("score", 0.0)}
                 for d in docs
             ],
-            "confidence": round(avg_confidence, 3)
+            "confidence": round(avg_confidence, 3),
+            "context_tokens": count_tokens(context, self.encoding_name),
+            **stats
         }
 
-        return {"prompt": prompt, "metadata": metadata}
\ No newline at end of file
+        return {"prompt": prompt, "metadata": metadata}
+
+    def pack(self, docs: List[Dict[str, Any]], max_tokens: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Select docs for a context of at most `max_tokens` tokens. Returns the
+        packed docs (the last one possibly with truncated text) and counts of
+        docs dropped as duplicates and for lack of budget.
+        """
+        rank_key = next((key for key in _RANK_KEYS if all(key in doc for doc in docs)), None)
+        if rank_key is not None:
+            docs = sorted(docs, key=lambda doc: doc[rank_key], reverse=True)
+
+        packed, packed_shingles, used = [], [], 0
+        stats = {"docs_deduplicated": 0, "docs_over_budget": 0, "docs_truncated": 0}
+        for i, doc in enumerate(docs):
+            text = doc.get("text", "").strip()
+            shingles = _shingles(text)
+            if any(len(shingles & seen) >= self.overlap_threshold * len(shingles) for seen in packed_shingles):
+                stats["docs_deduplicated"] += 1
+                continue
+            header = f"[Source {len(packed) + 1}: {doc['metadata'].get('source', 'Unknown')}]\n"
+            header_tokens = count_tokens(header, self.encoding_name)
+            remaining = max_tokens - used - header_tokens
+            tokens = count_tokens(text, self.encoding_name)
+            if tokens > remaining:
+                text, tokens = self._truncate(text, remaining)
+                if not text:
+                    stats["docs_over_budget"] += len(docs) - i
+                    break
+                doc = {**doc, "text": text}
+                stats["docs_truncated"] += 1
+            packed.append(doc)
+            packed_shingles.append(shingles)
+            used += header_tokens + tokens + 1  # +1 for the newline between blocks
+        return packed, stats
+
+    def _truncate(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """Longest prefix of whole sentences within `max_tokens`, with its token count ("" if none fits)."""
+        kept, kept_tokens = "", 0
+        ends = [match.start() for match in _SENTENCE_END_RE.finditer(text)] + [len(text)]
+        for end in ends:
+            tokens = count_tokens(text[:end], self.encoding_name)
+            if tokens > max_tokens:
+                break
+            kept, kept_tokens = text[:end], tokens
+        return kept, kept_tokens
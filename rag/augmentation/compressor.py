@@ -0,0 +1,139 @@
+"""
+Extractive context compression: keep only the retrieved sentences relevant to the query.
+"""
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import numpy as np
+from rag.retrieval.bm25_index import tokenize
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# Sentence ends, plus line breaks: CSV/JSON records are chunked as one field per line
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_SPLIT_RE.split(text.strip()) if sentence]
+
+
+def lexical_sentence_scores(query: str, sentences: Sequence[str]) -> np.ndarray:
+    """
+    IDF-weighted fraction of query terms in each sentence, as one
+    (sentences x query terms) presence matrix product; the dependency-free fallback scorer.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms or not sentences:
+        return np.zeros(len(sentences), dtype=np.float32)
+    column = {term: j for j, term in enumerate(terms)}
+    presence = np.zeros((len(sentences), len(terms)), dtype=np.float32)
+    for i, sentence in enumerate(sentences):
+        hits = [column[token] for token in set(tokenize(sentence)) if token in column]
+        presence[i, hits] = 1.0
+    idf = np.log((len(sentences) + 1) / (presence.sum(axis=0) + 1)) + 1.0
+    return presence @ idf / idf.sum()
+
+
+class ExtractiveCompressor:
+    """
+    Splits retrieved chunks into sentences, scores all of them against the
+    query in one batch and keeps the `max_sentences` best (those above
+    `min_score`), in their original order inside each doc. Docs keep their
+    id, metadata and retrieval scores, so source attribution survives; docs
+    with no kept sentence are dropped. If no sentence scores above
+    `min_score` the docs are returned unchanged rather than emptied.
+
+    Scoring is cosine similarity under a local sentence-transformers model
+    on CPU (sentence embeddings cached by hash, since the same chunks come
+    back for recurring questions), falling back to IDF-weighted lexical
+    overlap when sentence-transformers is not installed. `encoder` may be
+    any function mapping a list of texts to a (n, dim) embedding matrix.
+    """
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 encoder: Optional[Callable[[List[str]], np.ndarray]] = None, max_sentences: int = 10,
+                 min_score: float = 0.0, batch_size: int = 64, cache_size: int = 100000):
+        self.model_name = model_name
+        self.max_sentences = max_sentences
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._encoder = encoder
+        self._use_lexical = False
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_encoder(self) -> Optional[Callable[[List[str]], np.ndarray]]:
+        if self._encoder is None and not self._use_lexical:
+            if SentenceTransformer is None:
+                print("sentence-transformers not installed. Falling back to lexical sentence scoring.")
+                self._use_lexical = True
+            else:
+                model = SentenceTransformer(self.model_name, device="cpu")
+                self._encoder = lambda texts: model.encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+        return self._encoder
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Row-normalized embeddings for `texts`, encoding only those not cached."""
+        keys = [hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest() for text in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    vectors[i] = self._cache[key]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = np.asarray(self._get_encoder()([texts[i] for i in missing]), dtype=np.float32)
+            fresh /= np.maximum(np.linalg.norm(fresh, axis=1, keepdims=True), 1e-12)
+            with self._lock:
+                for i, vector in zip(missing, fresh):
+                    vectors[i] = self._cache[keys[i]] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return np.stack(vectors)
+
+    def score(self, query: str, sentences: List[str]) -> np.ndarray:
+        if not sentences:
+            return np.zeros(0, dtype=np.float32)
+        if self._get_encoder() is None:
+            return lexical_sentence_scores(query, sentences)
+        embeddings = self._embed([query] + sentences)
+        return embeddings[1:] @ embeddings[0]
+
+    def compress(self, query: str, docs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Return (compressed docs, stats) where stats["compression_ratio"] is output / input characters."""
+        sentences, owners = [], []
+        for d, doc in enumerate(docs):
+            for sentence in split_sentences(doc.get("text", "")):
+                sentences.append(sentence)
+                owners.append(d)
+        chars_in = sum(len(doc.get("text", "")) for doc in docs)
+        scores = self.score(query, sentences)
+
+        keep = np.flatnonzero(scores > self.min_score)
+        if len(keep) == 0:  # no signal: better to send everything than nothing
+            compressed, kept = docs, len(sentences)
+        else:
+            keep = keep[np.argsort(-scores[keep], kind="stable")[:self.max_sentences]]
+            kept_by_doc: Dict[int, List[int]] = {}
+            for i in sorted(keep):
+                kept_by_doc.setdefault(owners[i], []).append(i)
+            compressed = [
+                {**docs[d], "text": " ".join(sentences[i] for i in kept_by_doc[d]),
+                 "compression_score": float(scores[kept_by_doc[d]].max())}
+                for d in range(len(docs)) if d in kept_by_doc
+            ]
+            kept = len(keep)
+        chars_out = sum(len(doc.get("text", "")) for doc in compressed)
+        stats = {
+            "sentences_in": len(sentences),
+            "sentences_kept": kept,
+            "chars_in": chars_in,
+            "chars_out": chars_out,
+            "compression_ratio": round(chars_out / chars_in, 3) if chars_in else 1.0
+        }
+        return compressed, stats
@@ -41,6 +41,9 @@ GOLDEN_PATH = "rag/evaluation/data/my_ecommerce.jsonl"
 with open(GOLDEN_PATH) as f:
     my_ecom = [json.loads(line) for line in f]
 
+# Fallback contexts for every query, fetched in one batched retrieval pass
+fallback_docs = controller.retriever.retrieve_many([item["query"] for item in my_ecom], top_k=5)
+
 # Run inference
 results = []
 print(f"Evaluating {len(my_ecom)} queries...")
@@ -54,9 +57,8 @@ for i, item in enumerate(my_ecom):
         # Note: Add retrieved_docs to controller.query() return if missing
         retrieved_docs = getattr(output, "retrieved_docs", [])
         if not retrieved_docs:
-            # Fallback: re-retrieve to get docs
-            docs = controller.retriever.retrieve(item["query"], top_k=5)
-            retrieved_docs = [{"text": d["text"]} for d in docs]
+            # Fallback: use the batch-retrieved docs
+            retrieved_docs = [{"text": d["text"]} for d in fallback_docs[i]]
 
         results.append({
             "question": item["query"],
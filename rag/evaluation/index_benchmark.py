@@ -0,0 +1,137 @@
+"""
+Recall / latency / memory benchmark for the local vector store variants.
+
+Usage:
+    python -m rag.evaluation.index_benchmark --snapshot data/index --queries 200 --k 5
+    python -m rag.evaluation.index_benchmark --snapshot data/index --dims 256 512 1024 --reduction pca
+    python -m rag.evaluation.index_benchmark --snapshot data/index --shards 4 --batch-size 32
+"""
+from typing import List, Dict, Any
+import argparse
+import json
+import time
+import numpy as np
+from rag.retrieval.vector_store import InMemoryVectorStore, normalize, top_k_rows
+from rag.retrieval.ivf_store import IVFVectorStore
+from rag.retrieval.quantized_store import QuantizedVectorStore
+from rag.retrieval.reduction import PCAReducer, TruncationReducer, project_store
+from rag.retrieval.sharded_store import ShardedVectorStore
+
+
+def exact_neighbours(matrix: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth top-k row indices by exact cosine similarity."""
+    return top_k_rows(normalize(queries) @ np.asarray(matrix).T, k)
+
+
+def resident_bytes(store: InMemoryVectorStore) -> int:
+    """Bytes of search structures the store keeps in RAM (memory-mapped arrays excluded)."""
+    total = 0
+    for name in ("_matrix", "_codes", "_scales", "centroids"):
+        array = getattr(store, name, None)
+        if isinstance(array, np.ndarray) and not isinstance(array, np.memmap):
+            total += array.nbytes
+    return total
+
+
+def benchmark_store(store: InMemoryVectorStore, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, Any]:
+    """recall@k against `truth` (row indices of the exact search) plus mean latency per query."""
+    truth_ids = [{store.ids[row] for row in rows} for rows in truth]
+    start = time.perf_counter()
+    results = [store.query(q, top_k=k) for q in queries]
+    elapsed = time.perf_counter() - start
+    recall = np.mean([len({r["id"] for r in res} & ids) / len(ids) for res, ids in zip(results, truth_ids)])
+    return {
+        f"recall@{k}": round(float(recall), 4),
+        "ms_per_query": round(1000 * elapsed / len(queries), 3),
+        "resident_mb": round(resident_bytes(store) / 2**20, 2)
+    }
+
+
+def throughput(store, queries: np.ndarray, k: int, batch_size: int) -> Dict[str, Any]:
+    """Queries per second answered through `query_batch` in batches of `batch_size` (one warm-up batch first)."""
+    store.query_batch(queries[:batch_size], top_k=k)
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        store.query_batch(queries[i:i + batch_size], top_k=k)
+    elapsed = time.perf_counter() - start
+    return {"queries_per_s": round(len(queries) / elapsed, 1), "batch_size": batch_size}
+
+
+def reduction_report(store: InMemoryVectorStore, queries: np.ndarray, truth: np.ndarray, k: int,
+                     dims: List[int], method: str = "pca") -> List[Dict[str, Any]]:
+    """
+    For each target dimension, fit a reducer on the store's corpus, project
+    corpus and queries, and report recall@k against full-dimension ground
+    truth alongside the latency / memory gain over the full-dimension index.
+    """
+    baseline = benchmark_store(store, queries, truth, k)
+    rows = [{"dim": store.dim, **baseline, "speedup": 1.0, "memory_ratio": 1.0}]
+    for dim in sorted(dims, reverse=True):
+        if dim >= store.dim:
+            continue
+        reducer = PCAReducer(dim).fit(store.matrix) if method == "pca" else TruncationReducer(dim)
+        reduced = project_store(store, reducer, store_cls=InMemoryVectorStore)
+        result = benchmark_store(reduced, reducer.transform(queries), truth, k)
+        rows.append({
+            "dim": dim,
+            **result,
+            "speedup": round(baseline["ms_per_query"] / max(result["ms_per_query"], 1e-9), 2),
+            "memory_ratio": round(result["resident_mb"] / max(baseline["resident_mb"], 1e-9), 3)
+        })
+    return rows
+
+
+def sample_queries(matrix: np.ndarray, n: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """Held-out-like queries: random corpus rows perturbed with Gaussian noise."""
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(matrix[rng.choice(len(matrix), size=min(n, len(matrix)), replace=False)])
+    return normalize(rows + noise * rng.standard_normal(rows.shape).astype(np.float32) / np.sqrt(rows.shape[1]))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshot", required=True, help="Directory written by InMemoryVectorStore.save()")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, nargs="*", help="Report recall loss vs. speed/memory gain for these target dimensions")
+    parser.add_argument("--reduction", choices=["pca", "truncate"], default="pca")
+    parser.add_argument("--shards", type=int, help="Compare exact-search throughput with ShardedVectorStore on this many processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per query_batch call for --shards")
+    args = parser.parse_args(argv)
+
+    exact = InMemoryVectorStore.load(args.snapshot, mmap=False)
+    queries = sample_queries(exact.matrix, args.queries)
+    truth = exact_neighbours(exact.matrix, queries, args.k)
+
+    if args.dims:
+        report = reduction_report(exact, queries, truth, args.k, args.dims, method=args.reduction)
+        print(json.dumps(report, indent=2))
+        return report
+
+    if args.shards:
+        exact = InMemoryVectorStore.load(args.snapshot, mmap=True)
+        sharded = ShardedVectorStore(exact, n_shards=args.shards, min_parallel_rows=0)
+        try:
+            report = {
+                "exact": throughput(exact, queries, args.k, args.batch_size),
+                f"sharded x{args.shards}": throughput(sharded, queries, args.k, args.batch_size)
+            }
+        finally:
+            sharded.close()
+        print(json.dumps(report, indent=2))
+        return report
+
+    ivf = IVFVectorStore.load(args.snapshot, mmap=False)
+    if not ivf.is_trained:
+        ivf.train()
+    report = {
+        "exact": benchmark_store(exact, queries, truth, args.k),
+        "int8+rescore": benchmark_store(QuantizedVectorStore.load(args.snapshot, mmap=True), queries, truth, args.k),
+        "ivf": benchmark_store(ivf, queries, truth, args.k)
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
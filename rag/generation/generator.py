@@ -1,19 +1,25 @@
 """
 Generator: Calls DeepSeek-R1 for final response using augmented prompt.
 Update: Supports tool calling with LLM.
+Update: `generate_stream` yields tokens as they arrive.
+Update: AsyncRAGGenerator runs independent tool calls concurrently.
 """
-from openai import OpenAI
-from typing import Dict, Any, List
+from openai import AsyncOpenAI, OpenAI
+from typing import Dict, Any, Iterator, List, Tuple
+import asyncio
+import json
 import os
 from rag.agents.tools.tool_registry import TOOL_REGISTRY
 from dotenv import load_dotenv
 
 load_dotenv()
 
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
 class RAGGenerator:
     def __init__(self):
         self.client = OpenAI(
-            base_url="https://api.deepseek.com/v1",
+            base_url=DEEPSEEK_BASE_URL,
             api_key=os.getenv("DEEPSEEK_API_KEY")
         )
         self.model = "deepseek-r1"
@@ -34,25 +40,12 @@ class RAGGenerator:
 
             # Handle tool calls
             if msg.tool_calls:
-                tool_results = []
-                for tool_call in msg.tool_calls:
-                    func_name = tool_call.function.name
-                    args = json.loads(tool_call.function.arguments)
-                    tool = TOOL_REGISTRY[func_name]
-                    result = tool.execute(args)
-                    tool_results.append({
-                        "tool": func_name,
-                        "input": args,
-                        "output": result
-                    })
-                    # Add tool result to messages
-                    messages.append(msg)
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "name": func_name,
-                        "content": json.dumps(result)
-                    })
+                # The assistant turn that requested the tools, once, followed by one result per call
+                messages.append(msg)
+                tool_results = self._run_tools(
+                    [(tool_call.id, tool_call.function.name, tool_call.function.arguments) for tool_call in msg.tool_calls],
+                    messages
+                )
                 # Final generation
                 final_resp = self.client.chat.completions.create(
                     model=self.model,
@@ -67,4 +60,163 @@ class RAGGenerator:
                 return {"response": msg.content, "tool_calls": []}
 
         except Exception as e:
-            return {"response": "Sorry, I'm having trouble.", "tool_calls": [], "error": str(e)}
\ No newline at end of file
+            return {"response": "Sorry, I'm having trouble.", "tool_calls": [], "error": str(e)}
+
+    def generate_stream(self, messages: List[Dict], use_tools: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the completion as events: {"type": "token", "content"} per text
+        delta, {"type": "tool_call", "tool", "input", "output"} per executed
+        tool, then one {"type": "done", "response", "tool_calls"} (plus "error"
+        on failure). Tool calls are assembled from the streamed deltas, run,
+        and the follow-up completion is streamed the same way.
+        """
+        response, tool_results = "", []
+        try:
+            calls: Dict[int, Dict[str, str]] = {}
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=500,
+                tools=self.tools if use_tools else None,
+                tool_choice="auto" if use_tools else None,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    response += delta.content
+                    yield {"type": "token", "content": delta.content}
+                # Tool call names and arguments arrive in fragments, keyed by call index
+                for part in delta.tool_calls or []:
+                    call = calls.setdefault(part.index, {"id": "", "name": "", "arguments": ""})
+                    call["id"] = part.id or call["id"]
+                    if part.function is not None:
+                        call["name"] += part.function.name or ""
+                        call["arguments"] += part.function.arguments or ""
+
+            if calls:
+                ordered = [calls[index] for index in sorted(calls)]
+                messages.append({
+                    "role": "assistant",
+                    "content": response or None,
+                    "tool_calls": [
+                        {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+                        for call in ordered
+                    ]
+                })
+                tool_results = self._run_tools([(call["id"], call["name"], call["arguments"]) for call in ordered], messages)
+                for result in tool_results:
+                    yield {"type": "tool_call", **result}
+                # Final generation
+                response = ""
+                for chunk in self.client.chat.completions.create(model=self.model, messages=messages, max_tokens=300, stream=True):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        response += chunk.choices[0].delta.content
+                        yield {"type": "token", "content": chunk.choices[0].delta.content}
+
+            yield {"type": "done", "response": response, "tool_calls": tool_results}
+
+        except Exception as e:
+            yield {"type": "done", "response": response or "Sorry, I'm having trouble.", "tool_calls": tool_results, "error": str(e)}
+
+    def _run_tools(self, calls: List[Tuple[str, str, str]], messages: List[Dict]) -> List[Dict[str, Any]]:
+        """Execute (id, name, json arguments) tool calls, appending one tool message per result."""
+        tool_results = []
+        for call_id, func_name, arguments in calls:
+            args = json.loads(arguments or "{}")
+            result = self._run_tool(func_name, args)
+            tool_results.append({
+                "tool": func_name,
+                "input": args,
+                "output": result
+            })
+            # Add tool result to messages
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call_id,
+                "name": func_name,
+                "content": json.dumps(result, default=str)
+            })
+        return tool_results
+
+    def _run_tool(self, func_name: str, args: Dict) -> Any:
+        """A tool that is unknown or raises gives the model an {"error": ...} result, as in AsyncRAGGenerator."""
+        tool = TOOL_REGISTRY.get(func_name)
+        try:
+            if tool is None:
+                raise KeyError(f"unknown tool {func_name!r}")
+            return tool.execute(args)
+        except Exception as e:
+            return {"error": f"{func_name} failed: {e}"}
+
+
+class AsyncRAGGenerator:
+    """
+    asyncio counterpart of RAGGenerator on AsyncOpenAI. All tool calls of one
+    model response run concurrently, so the turn costs the slowest tool, not
+    the sum. Each call is bounded by its Tool.timeout; a tool that times out
+    or raises gives the model an {"error": ...} result instead of failing
+    the whole answer.
+    """
+    def __init__(self):
+        self.client = AsyncOpenAI(
+            base_url=DEEPSEEK_BASE_URL,
+            api_key=os.getenv("DEEPSEEK_API_KEY")
+        )
+        self.model = "deepseek-r1"
+        self.tools = [tool.to_schema() for tool in TOOL_REGISTRY.values()]
+
+    async def generate(self, messages: List[Dict], use_tools: bool = True) -> Dict[str, Any]:
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=500,
+                tools=self.tools if use_tools else None,
+                tool_choice="auto" if use_tools else None
+            )
+
+            msg = response.choices[0].message
+            if not msg.tool_calls:
+                return {"response": msg.content, "tool_calls": []}
+
+            messages.append(msg)
+            calls = [(tool_call.function.name, json.loads(tool_call.function.arguments or "{}")) for tool_call in msg.tool_calls]
+            outputs = await asyncio.gather(*(self._arun_tool(name, args) for name, args in calls))
+            tool_results = []
+            for tool_call, (func_name, args), result in zip(msg.tool_calls, calls, outputs):
+                tool_results.append({"tool": func_name, "input": args, "output": result})
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "name": func_name,
+                    "content": json.dumps(result, default=str)
+                })
+            # Final generation
+            final_resp = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=300
+            )
+            return {
+                "response": final_resp.choices[0].message.content,
+                "tool_calls": tool_results
+            }
+
+        except Exception as e:
+            return {"response": "Sorry, I'm having trouble.", "tool_calls": [], "error": str(e)}
+
+    async def _arun_tool(self, func_name: str, args: Dict) -> Any:
+        tool = TOOL_REGISTRY.get(func_name)
+        try:
+            if tool is None:
+                raise KeyError(f"unknown tool {func_name!r}")
+            return await tool.aexecute(args)
+        except asyncio.TimeoutError:
+            return {"error": f"{func_name} timed out after {tool.timeout}s"}
+        except Exception as e:
+            return {"error": f"{func_name} failed: {e}"}
@@ -1,16 +1,80 @@
 """
 Chunker for semantic/sliding window chunking of documents using LangChain.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import functools
+import multiprocessing
+import threading
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_ENCODING = "cl100k_base"  # tokenizer of the OpenAI embedding and chat models we use
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING):
+    """Cached tiktoken encoding, or None (token counts are then estimated) if unavailable."""
+    if tiktoken is None:
+        print("tiktoken not installed. Estimating token counts at ~4 characters per token.")
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:  # e.g. encoding file cannot be downloaded offline
+        print(f"tiktoken encoding {encoding_name} unavailable ({e}). Estimating token counts.")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# Per-process chunker used by the parallel path, built once by _init_chunk_worker
+_worker_chunker = None
+
+
+def _init_chunk_worker(config: Dict[str, Any]):
+    global _worker_chunker
+    _worker_chunker = DocumentChunker(**config)
+
+
+def _chunk_texts(texts: List[str]) -> List[List[str]]:
+    return [_worker_chunker.chunk_text(text) for text in texts]
+
 
 class DocumentChunker:
-    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50):
+    """
+    `length_unit="tokens"` measures chunk_size / chunk_overlap in model tokens
+    (tiktoken `encoding_name`) instead of characters, so chunks have
+    predictable token counts. With `max_workers > 1`, `chunk_docs` /
+    `iter_chunks` split documents in a process pool and stream chunks back in
+    document order. The pool is started on first use and shared by later
+    calls (also from several threads); `close()` shuts it down.
+    """
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50, length_unit: str = "chars",
+                 encoding_name: str = DEFAULT_ENCODING, max_workers: int = 1, docs_per_task: int = 16):
+        if length_unit not in ("chars", "tokens"):
+            raise ValueError(f"length_unit must be 'chars' or 'tokens', got {length_unit!r}")
+        self._config = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                        "length_unit": length_unit, "encoding_name": encoding_name}
+        self.max_workers = max_workers
+        self.docs_per_task = docs_per_task
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", " ", ""],  # Semantic separators: paragraphs, lines, sentences, words
-            keep_separator=True
+            keep_separator=True,
+            length_function=functools.partial(count_tokens, encoding_name=encoding_name) if length_unit == "tokens" else len
         )
 
     def chunk_text(self, text: str) -> List[str]:
@@ -19,16 +83,51 @@ class DocumentChunker:
 
     def chunk_docs(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Chunk multiple docs and add metadata."""
-        chunked = []
-        for idx, doc in enumerate(docs):
-            chunks = self.chunk_text(doc["text"])
+        return list(self.iter_chunks(docs))
+
+    def iter_chunks(self, docs: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Stream chunks of `docs` in document order, splitting in parallel when max_workers > 1."""
+        docs = iter(docs)
+        for idx, (doc, chunks) in enumerate(self._split(docs)):
             for i, chunk in enumerate(chunks):
-                chunked.append({
+                yield {
                     "doc_id": doc.get("doc_id", idx),
                     "chunk_id": i,
                     "text": chunk,
                     "total_chunks": len(chunks),
                     "source": doc.get("source", "unknown"),
                     "metadata": doc.get("metadata", {})
-                })
-        return chunked
\ No newline at end of file
+                }
+
+    def _split(self, docs: Iterator[Dict[str, Any]]):
+        if self.max_workers <= 1:
+            for doc in docs:
+                yield doc, self.chunk_text(doc["text"])
+            return
+        pool = self._get_pool()
+        # Ordered window of in-flight tasks: bounded memory, results yielded in submission order
+        window = deque()
+        while True:
+            while len(window) < 2 * self.max_workers:
+                batch = list(islice(docs, self.docs_per_task))
+                if not batch:
+                    break
+                window.append((batch, pool.submit(_chunk_texts, [doc["text"] for doc in batch])))
+            if not window:
+                return
+            batch, future = window.popleft()
+            yield from zip(batch, future.result())
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned, not forked: the pool is created from pipeline threads, and forking a threaded process can deadlock
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_chunk_worker,
+                                                 initargs=(self._config,), mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,176 @@
+"""
+Near-duplicate chunk detection with MinHash signatures and LSH banding.
+"""
+from typing import List, Dict, Any, Optional, Set
+import json
+import os
+import re
+import threading
+import zlib
+import numpy as np
+
+DEDUP_STATE_FILE = "dedup_state.json"
+DEDUP_SIGNATURES_FILE = "dedup_signatures.npy"
+
+_WORD_RE = re.compile(r"\w+")
+# Smallest prime above 2**32: with 32-bit shingle hashes and a, b < 2**32,
+# a * x + b stays below 2**64, so the permutations run in uint64 without overflow.
+_PRIME = np.uint64(4294967311)
+
+
+class NearDuplicateFilter:
+    """
+    Collapses chunks whose word-shingle Jaccard similarity is at least
+    `threshold` onto one canonical chunk (the first one seen).
+
+    Each chunk gets a `num_perm`-value MinHash signature, split into `bands`
+    LSH bands; only chunks sharing a band bucket are compared, and a candidate
+    counts as a duplicate when the fraction of equal signature values (the
+    Jaccard estimate) reaches `threshold`. Work per chunk is constant, so a
+    corpus is processed in near-linear time.
+
+    The filter remembers every canonical chunk's signature and its sources,
+    so it can run over a stream (`match`) or a list (`dedupe`), and persists
+    with `save` / `load` for incremental ingestion.
+    """
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, shingle_size: int = 3, seed: int = 0):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._ids: List[Optional[str]] = []  # canonical id per row; None once removed
+        self._signatures: List[np.ndarray] = []
+        self._row: Dict[str, int] = {}
+        self._sources: Dict[str, Set[str]] = {}
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"chunks_seen": 0, "near_duplicates": 0, "chars_seen": 0, "chars_removed": 0}
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        k = self.shingle_size
+        shingles = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((hashes[:, None] * self._a + self._b) % _PRIME).min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [(band, part.tobytes()) for band, part in enumerate(signature.reshape(self.bands, -1))]
+
+    def _register(self, chunk_id: str, signature: np.ndarray, source: str):
+        row = len(self._ids)
+        self._ids.append(chunk_id)
+        self._signatures.append(signature)
+        self._row[chunk_id] = row
+        self._sources[chunk_id] = {source}
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(row)
+
+    def match(self, chunk: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the id of the canonical chunk `chunk` duplicates, recording its
+        source there; otherwise register `chunk` as canonical and return None.
+        A chunk that is itself already canonical (a re-run) is not a duplicate.
+        """
+        source = chunk.get("metadata", {}).get("source", chunk.get("source", "unknown"))
+        signature = self.signature(chunk["text"])
+        with self._lock:
+            self.stats["chunks_seen"] += 1
+            self.stats["chars_seen"] += len(chunk["text"])
+            if chunk["id"] in self._row:
+                self._sources[chunk["id"]].add(source)
+                return None
+            candidates = {row for key in self._band_keys(signature) for row in self._buckets.get(key, ())}
+            best, best_similarity = None, self.threshold
+            for row in candidates:
+                if self._ids[row] is None:
+                    continue
+                similarity = float(np.mean(self._signatures[row] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = row, similarity
+            if best is None:
+                self._register(chunk["id"], signature, source)
+                return None
+            canonical = self._ids[best]
+            self._sources[canonical].add(source)
+            self.stats["near_duplicates"] += 1
+            self.stats["chars_removed"] += len(chunk["text"])
+            return canonical
+
+    def dedupe(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Drop near-duplicates from `chunks`. Kept chunks get metadata "sources"
+        (every source the chunk occurs in) and "duplicate_ids" (collapsed ids).
+        """
+        kept: Dict[str, Dict[str, Any]] = {}
+        for chunk in chunks:
+            canonical = self.match(chunk)
+            if canonical is None:
+                chunk["metadata"] = {**chunk.get("metadata", {}), "sources": self.sources(chunk["id"]), "duplicate_ids": []}
+                kept[chunk["id"]] = chunk
+            elif canonical in kept:
+                kept[canonical]["metadata"]["sources"] = self.sources(canonical)
+                kept[canonical]["metadata"]["duplicate_ids"].append(chunk["id"])
+        return list(kept.values())
+
+    def sources(self, chunk_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self._sources.get(chunk_id, ()))
+
+    def discard_source(self, chunk_id: str, source: str) -> List[str]:
+        """Forget that `source` contains `chunk_id`; returns the remaining sources."""
+        with self._lock:
+            self._sources.get(chunk_id, set()).discard(source)
+            return sorted(self._sources.get(chunk_id, ()))
+
+    def remove(self, chunk_ids: List[str]):
+        """Stop treating `chunk_ids` as canonical (their chunks left the index)."""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                row = self._row.pop(chunk_id, None)
+                if row is not None:
+                    self._ids[row] = None  # bucket entries are skipped from now on
+                    self._sources.pop(chunk_id, None)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["removed_fraction"] = round(stats["chars_removed"] / stats["chars_seen"], 4) if stats["chars_seen"] else 0.0
+        return stats
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            live = [row for row, chunk_id in enumerate(self._ids) if chunk_id is not None]
+            signatures = np.stack([self._signatures[row] for row in live]) if live else np.empty((0, self.num_perm), dtype=np.uint32)
+            state = {
+                "threshold": self.threshold, "num_perm": self.num_perm, "bands": self.bands,
+                "shingle_size": self.shingle_size, "seed": self.seed,
+                "ids": [self._ids[row] for row in live],
+                "sources": [sorted(self._sources[self._ids[row]]) for row in live]
+            }
+        signatures_path = os.path.join(path, DEDUP_SIGNATURES_FILE)
+        with open(signatures_path + ".tmp", "wb") as f:
+            np.save(f, signatures)
+        os.replace(signatures_path + ".tmp", signatures_path)
+        state_path = os.path.join(path, DEDUP_STATE_FILE)
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(state_path + ".tmp", state_path)
+
+    @classmethod
+    def load(cls, path: str) -> "NearDuplicateFilter":
+        with open(os.path.join(path, DEDUP_STATE_FILE), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        dedup = cls(threshold=state["threshold"], num_perm=state["num_perm"], bands=state["bands"],
+                    shingle_size=state["shingle_size"], seed=state["seed"])
+        signatures = np.load(os.path.join(path, DEDUP_SIGNATURES_FILE))
+        for chunk_id, signature, sources in zip(state["ids"], signatures, state["sources"]):
+            dedup._register(chunk_id, signature, sources[0] if sources else "unknown")
+            dedup._sources[chunk_id] = set(sources)
+        return dedup
@@ -0,0 +1,104 @@
+"""
+Incremental, manifest-driven indexing of a document directory.
+"""
+from typing import List, Dict, Any, Iterable, Tuple
+from collections import Counter
+import hashlib
+import json
+import os
+from rag.ingestion.loader import DocumentLoader, SUPPORTED_EXTENSIONS
+from rag.ingestion.chunker import DocumentChunker
+from rag.ingestion.manifest import IngestionManifest
+
+
+def chunk_id(file_key: str, text: str, metadata: Dict[str, Any], occurrence: int = 0) -> str:
+    """
+    Stable chunk id derived from the source file and the chunk's content, so an
+    unchanged chunk keeps its id when other parts of the file are edited.
+    `occurrence` separates identical chunks within one file.
+    """
+    file_part = hashlib.sha1(file_key.encode("utf-8")).hexdigest()[:12]
+    content = json.dumps([text, metadata], sort_keys=True, ensure_ascii=False, default=str)
+    content_part = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+    return f"{file_part}-{content_part}-{occurrence}"
+
+
+def build_chunks(file_key: str, docs: List[Dict[str, Any]], chunker: DocumentChunker) -> List[Dict[str, Any]]:
+    """Chunk one file's documents and give every chunk its stable id and "source" metadata."""
+    chunks = chunker.chunk_docs(docs)
+    seen = Counter()
+    for chunk in chunks:
+        # Keep document metadata (product_id, category, ...) so retrieval can filter on it
+        chunk["metadata"] = {**chunk.get("metadata", {}), "source": chunk.get("source", file_key)}
+        base = chunk_id(file_key, chunk["text"], chunk["metadata"])
+        chunk["id"] = chunk_id(file_key, chunk["text"], chunk["metadata"], seen[base])
+        seen[base] += 1
+    return chunks
+
+
+class IncrementalIndexer:
+    """
+    Brings a set of indexes (vector stores, BM25Index, ... -- anything with
+    `add_documents(chunks)` and `delete(ids)`) in line with `source_dir`
+    using an IngestionManifest. Only new or modified files are loaded and
+    chunked; of their chunks, only ids not already indexed are upserted (and
+    so embedded), and ids a file no longer produces -- or every id of a
+    deleted file -- are removed from the indexes.
+
+    The manifest is updated in memory; save it only after the indexes have
+    been persisted, so a crash replays the run instead of losing it.
+    """
+    def __init__(self, source_dir: str, indexes: List[Any], chunker: DocumentChunker = None,
+                 loader: DocumentLoader = None):
+        self.source_dir = source_dir
+        self.indexes = indexes
+        self.chunker = chunker or DocumentChunker(chunk_size=512, chunk_overlap=50)
+        self.loader = loader or DocumentLoader(source_dir=source_dir)
+
+    def changes(self, manifest: IngestionManifest) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[str]]:
+        """(changed, removed) files of source_dir relative to `manifest` (see IngestionManifest.diff)."""
+        return manifest.diff(self.source_dir, SUPPORTED_EXTENSIONS)
+
+    def chunk(self, file_key: str, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One file's documents as chunks carrying stable ids (see build_chunks)."""
+        return build_chunks(file_key, docs, self.chunker)
+
+    @staticmethod
+    def plan(chunks: List[Dict[str, Any]], previous_ids: Iterable[str],
+             kept_ids: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], List[str], int]:
+        """
+        Split a changed file's chunks against the ids it had indexed before:
+        returns (chunks to upsert, stale ids to delete, number unchanged).
+        `kept_ids` are further ids the file still holds without indexing them
+        itself (e.g. references to another file's identical chunk).
+        """
+        previous = set(previous_ids)
+        current = {chunk["id"] for chunk in chunks}.union(kept_ids)
+        upserts = [chunk for chunk in chunks if chunk["id"] not in previous]
+        return upserts, sorted(previous - current), len(previous & current)
+
+    def run(self, manifest: IngestionManifest) -> Dict[str, int]:
+        changed, removed = self.changes(manifest)
+        stats = {"files_changed": len(changed), "files_removed": len(removed),
+                 "chunks_upserted": 0, "chunks_deleted": 0, "chunks_unchanged": 0}
+
+        upserts, stale = [], []
+        for key in removed:
+            stale.extend(manifest.forget(key))
+        fingerprints = dict(changed)
+        for key, docs in self.loader.iter_files([os.path.join(self.source_dir, key) for key in fingerprints]):
+            chunks = self.chunk(key, docs)
+            file_upserts, file_stale, unchanged = self.plan(chunks, manifest.chunk_ids(key))
+            upserts.extend(file_upserts)
+            stale.extend(file_stale)
+            stats["chunks_unchanged"] += unchanged
+            manifest.record(key, fingerprints[key], [chunk["id"] for chunk in chunks])
+
+        for index in self.indexes:
+            if stale:
+                index.delete(stale)
+            if upserts:
+                index.add_documents(upserts)
+        stats["chunks_upserted"] = len(upserts)
+        stats["chunks_deleted"] = len(stale)
+        return stats
@@ -4,12 +4,22 @@ Loader for documents (PDF, CSV, JSON) for RAG ingestion pipeline.
 import os
 import json
 import csv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
 try:
     from pypdf import PdfReader
 except ImportError:
     PdfReader = None
 
+SUPPORTED_EXTENSIONS = (".json", ".pdf", ".csv")
+
+
+def extract_pdf_text(path: str) -> Dict[str, Any]:
+    """Text and page count of one PDF; module-level so it can run in a worker process."""
+    reader = PdfReader(path)
+    return {"text": "\n".join(page.extract_text() or "" for page in reader.pages), "pages": len(reader.pages)}
+
 class DocumentLoader:
     def __init__(self, source_dir: str):
         self.source_dir = source_dir
@@ -56,4 +66,133 @@ class DocumentLoader:
                         docs.extend(list(reader))
                 except Exception as e:
                     print(f"Error loading {fpath}: {e}")
-        return docs
\ No newline at end of file
+        return docs
+
+    def iter_documents(self, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream every supported file under source_dir as documents
+        {"text", "source", "metadata"} (see `load_file`) from a single walk.
+        Files are read as described in `iter_files`, so documents arrive in
+        no fixed order.
+        """
+        for _, docs in self.iter_files(max_workers=max_workers, max_in_flight=max_in_flight):
+            yield from docs
+
+    def iter_files(self, paths: Optional[Iterable[str]] = None, max_workers: Optional[int] = None,
+                   max_in_flight: Optional[int] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Stream (source, documents) per file for `paths` (default: every
+        supported file under source_dir), where source is the path relative
+        to source_dir. Every file is yielded exactly once, with an empty list
+        if it holds no documents or fails to load.
+
+        JSON and CSV files are read as they come. PDFs are extracted in a
+        process pool with at most `max_in_flight` files (default 2 * workers)
+        submitted at once, and yielded as they finish, so memory holds a
+        bounded number of PDF texts regardless of corpus size.
+        """
+        max_workers = max_workers or os.cpu_count() or 1
+        max_in_flight = max_in_flight or 2 * max_workers
+        pool, pending = None, {}
+        try:
+            for path in (self._walk() if paths is None else paths):
+                # Hand back PDFs that finished while we were reading other files
+                yield from self._pdf_docs([future for future in pending if future.done()], pending)
+                if not path.lower().endswith('.pdf'):
+                    yield os.path.relpath(path, self.source_dir), list(self._iter_records(path))
+                    continue
+                if PdfReader is None:
+                    print(f"pypdf not installed. Skipping {path}")
+                    yield os.path.relpath(path, self.source_dir), []
+                    continue
+                if pool is None:
+                    # Spawned, not forked: callers such as the ingestion pipeline iterate from worker threads
+                    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+                while len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._pdf_docs(done, pending)
+                pending[pool.submit(extract_pdf_text, path)] = path
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._pdf_docs(done, pending)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def _walk(self) -> Iterator[str]:
+        for root, dirs, fnames in os.walk(self.source_dir):
+            dirs.sort()
+            for fname in sorted(fnames):
+                if fname.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.join(root, fname)
+
+    def _pdf_docs(self, done, pending: Dict[Any, str]) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        for future in done:
+            path = pending.pop(future)
+            source = os.path.relpath(path, self.source_dir)
+            try:
+                extracted = future.result()
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+                yield source, []
+                continue
+            if not extracted["text"].strip():
+                yield source, []
+                continue
+            yield source, [{"text": extracted["text"], "source": source, "metadata": {"pages": extracted["pages"]}}]
+
+    def _iter_records(self, path: str) -> Iterator[Dict[str, Any]]:
+        """JSON objects / CSV rows of one file as documents, read lazily where the format allows."""
+        source = os.path.relpath(path, self.source_dir)
+        try:
+            if path.lower().endswith('.json'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                records = data if isinstance(data, list) else [data]
+                for record in records:
+                    if isinstance(record, dict):
+                        yield self._record_to_doc(record, source)
+            elif path.lower().endswith('.csv'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    for row in csv.DictReader(f):
+                        yield self._record_to_doc(row, source)
+        except Exception as e:
+            print(f"Error loading {path}: {e}")
+
+    def load_file(self, path: str, pdf_executor=None) -> List[Dict[str, Any]]:
+        """
+        Load one file as documents {"text", "source", "metadata"}, where
+        `source` is the path relative to source_dir. JSON objects and CSV rows
+        become one document each; a PDF becomes a single document, extracted
+        on `pdf_executor` (e.g. a shared ProcessPoolExecutor) if given.
+        """
+        if not path.lower().endswith('.pdf'):
+            return list(self._iter_records(path))
+        if PdfReader is None:
+            print("pypdf not installed. PDF loading disabled.")
+            return []
+        try:
+            if pdf_executor is not None:
+                extracted = pdf_executor.submit(extract_pdf_text, path).result()
+            else:
+                extracted = extract_pdf_text(path)
+        except Exception as e:
+            print(f"Error loading {path}: {e}")
+            return []
+        if not extracted["text"].strip():
+            return []
+        return [{"text": extracted["text"], "source": os.path.relpath(path, self.source_dir), "metadata": {"pages": extracted["pages"]}}]
+
+    @staticmethod
+    def _record_to_doc(record: Dict[str, Any], source: str) -> Dict[str, Any]:
+        """Use a "text"/"content" field if present, else render the fields as "key: value" lines; scalar fields become metadata."""
+        text = record.get("text") or record.get("content")
+        if not text:
+            text = "\n".join(f"{key}: {value}" for key, value in record.items() if value not in (None, ""))
+        metadata = {
+            key: value for key, value in record.items()
+            if key not in ("text", "content", "metadata") and isinstance(value, (str, int, float, bool))
+        }
+        if isinstance(record.get("metadata"), dict):
+            metadata.update(record["metadata"])
+        return {"text": str(text), "source": source, "metadata": metadata}
@@ -0,0 +1,107 @@
+"""
+Ingestion manifest: per-file fingerprints and the chunk ids each file produced.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+# Files are hashed in blocks of this size so large PDFs are never read into memory at once.
+_HASH_BLOCK = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    Records, for every ingested file (keyed by its path relative to the
+    source directory), its mtime, size, SHA-256 and the chunk ids it produced.
+
+    `diff` compares the manifest against a directory: a file whose mtime and
+    size are unchanged is skipped without reading it, and a file that was
+    touched but whose content hash matches is only re-stamped. The manifest is
+    written with rename-into-place, so an interrupted run leaves the previous
+    version intact.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._refs: Counter = Counter()  # files listing each chunk id (shared ids come from dedup)
+
+    @classmethod
+    def load(cls, path: str) -> "IngestionManifest":
+        manifest = cls(path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version: {data.get('version')}")
+            manifest.files = data["files"]
+            for entry in manifest.files.values():
+                manifest._refs.update(entry["chunk_ids"])
+        return manifest
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(self.path + ".tmp", self.path)
+
+    def diff(self, source_dir: str, extensions: Tuple[str, ...]) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[str]]:
+        """
+        Return (changed, removed): `changed` pairs each new or modified file key
+        with its fresh fingerprint, `removed` lists keys no longer on disk.
+        """
+        changed, seen = [], set()
+        own_path = os.path.abspath(self.path)
+        for root, _, fnames in os.walk(source_dir):
+            for fname in sorted(fnames):
+                if not fname.lower().endswith(extensions):
+                    continue
+                path = os.path.join(root, fname)
+                if os.path.abspath(path) == own_path:  # manifest kept inside source_dir
+                    continue
+                key = os.path.relpath(path, source_dir)
+                seen.add(key)
+                stat = os.stat(path)
+                entry = self.files.get(key)
+                if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    continue
+                fingerprint = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": file_sha256(path)}
+                if entry is not None and entry["sha256"] == fingerprint["sha256"]:
+                    entry.update(fingerprint)  # touched but identical
+                    continue
+                changed.append((key, fingerprint))
+        removed = [key for key in self.files if key not in seen]
+        return changed, removed
+
+    def chunk_ids(self, key: str) -> List[str]:
+        entry = self.files.get(key)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def record(self, key: str, fingerprint: Dict[str, Any], chunk_ids: List[str]):
+        self.forget(key)
+        self.files[key] = {**fingerprint, "chunk_ids": list(chunk_ids)}
+        self._refs.update(self.files[key]["chunk_ids"])
+
+    def forget(self, key: str) -> List[str]:
+        """Drop a file's entry and return the chunk ids it had produced."""
+        entry: Optional[Dict[str, Any]] = self.files.pop(key, None)
+        if entry is None:
+            return []
+        self._refs.subtract(entry["chunk_ids"])
+        return list(entry["chunk_ids"])
+
+    def ref_count(self, chunk_id: str) -> int:
+        """How many files currently list `chunk_id`; only unreferenced ids may leave the index."""
+        return max(0, self._refs[chunk_id])
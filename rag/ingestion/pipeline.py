@@ -0,0 +1,464 @@
+"""
+Streaming, resumable ingestion pipeline: load -> chunk -> dedupe -> embed -> upsert.
+
+Usage:
+    python -m rag.ingestion.pipeline --source-dir data/documents/raw --index-path data/index/vectors
+"""
+from typing import List, Dict, Any, Callable, Optional, Set
+from dataclasses import dataclass, field
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from rag.ingestion.loader import DocumentLoader
+from rag.ingestion.chunker import DocumentChunker, count_tokens
+from rag.ingestion.manifest import IngestionManifest
+from rag.ingestion.incremental import IncrementalIndexer
+from rag.ingestion.dedup import NearDuplicateFilter
+from rag.retrieval.batching import retry_call
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+
+@dataclass
+class FileWork:
+    """One source file as it moves through the pipeline; files are the unit of checkpointing."""
+    key: str
+    fingerprint: Dict[str, Any]
+    previous_ids: Set[str]
+    docs: List[Dict[str, Any]] = field(default_factory=list)
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    upserts: List[Dict[str, Any]] = field(default_factory=list)
+    stale_ids: List[str] = field(default_factory=list)
+    references: List[str] = field(default_factory=list)  # canonical chunks owned by other files (near-dedup)
+    shared_ids: List[str] = field(default_factory=list)  # canonical chunks whose "sources" changed (near-dedup)
+
+
+def drop_repeated_chunks(work: FileWork) -> FileWork:
+    """Default `dedupe_fn`: drop chunks repeated verbatim within the file (page headers, boilerplate)."""
+    seen, kept = set(), []
+    for chunk in work.chunks:
+        if chunk["text"] not in seen:
+            seen.add(chunk["text"])
+            kept.append(chunk)
+    work.chunks = kept
+    return work
+
+
+class IngestionPipeline:
+    """
+    Indexes the new and modified files under `source_dir` (per the
+    IngestionManifest) into `indexes` -- anything with `add_documents(chunks)`
+    and `delete(ids)` -- through five stages connected by bounded queues:
+
+      load    one thread streaming the files through DocumentLoader.iter_files;
+              PDFs are extracted in `load_workers` processes
+      chunk   `chunk_workers` threads, stable chunk ids (see build_chunks);
+              a chunker with max_workers > 1 splits text in its process pool
+      dedupe  one thread running `dedupe_fn(FileWork) -> FileWork`, or
+              corpus-wide MinHash near-dedup if `near_dedup` is given
+      embed   `embed_workers` threads, each embedding up to
+              `embed_batch_size` chunks (gathered across files) per call
+      upsert  one thread, the only writer to the indexes and the manifest
+
+    A full queue blocks its producer, so memory is bounded by `queue_size`
+    files per stage however large the corpus. Every `checkpoint_every` files
+    (or `checkpoint_seconds`), `checkpoint()` persists the indexes and the
+    manifest is saved after it, so a rerun skips every file committed by the
+    last checkpoint and resumes with the rest.
+
+    With near-dedup, a file may list chunk ids owned by another file; the
+    manifest reference-counts ids, so a shared chunk leaves the indexes only
+    once no file lists it, and its "sources" metadata is patched as files
+    come and go. Persist `near_dedup` in `checkpoint()` as well.
+    """
+    def __init__(self, source_dir: str, indexes: List[Any], embeddings, manifest: IngestionManifest,
+                 checkpoint: Optional[Callable[[], None]] = None, chunker: Optional[DocumentChunker] = None,
+                 loader: Optional[DocumentLoader] = None, dedupe_fn: Callable[[FileWork], FileWork] = drop_repeated_chunks,
+                 load_workers: int = 4, chunk_workers: int = 2, embed_workers: int = 4, embed_batch_size: int = 64,
+                 queue_size: int = 32, checkpoint_every: int = 50, checkpoint_seconds: float = 60.0,
+                 report_seconds: float = 10.0, near_dedup: Optional[NearDuplicateFilter] = None):
+        self.source_dir = source_dir
+        self.indexes = indexes
+        self.embeddings = embeddings
+        self.manifest = manifest
+        self.checkpoint = checkpoint
+        # Diffing, chunk ids and the upsert/stale split are shared with the serial indexer
+        self.indexer = IncrementalIndexer(source_dir, indexes, chunker=chunker, loader=loader)
+        self.chunker = self.indexer.chunker
+        self.loader = self.indexer.loader
+        self.dedupe_fn = dedupe_fn
+        self.near_dedup = near_dedup  # replaces dedupe_fn with corpus-wide near-duplicate collapsing
+        self.load_workers = load_workers
+        self.chunk_workers = chunk_workers
+        self.embed_workers = embed_workers
+        self.embed_batch_size = embed_batch_size
+        self.queue_size = queue_size
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        self.report_seconds = report_seconds
+        self._stats_lock = threading.Lock()
+        self._failed = threading.Event()
+        self._errors: List[BaseException] = []
+
+    # -- plumbing ---------------------------------------------------------
+
+    def _put(self, q: queue.Queue, item):
+        """Blocking put that gives up once another stage has failed, so no thread waits forever."""
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("pipeline aborted")
+
+    def _get(self, q: queue.Queue, timeout: Optional[float] = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._failed.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        raise RuntimeError("pipeline aborted")
+
+    def _stage(self, name: str, n_workers: int, work: Callable[[], None], out_q: Optional[queue.Queue]) -> List[threading.Thread]:
+        """Start `n_workers` threads running `work`; the last one to finish forwards the end marker."""
+        remaining = [n_workers]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                work()
+            except BaseException as e:
+                if not self._failed.is_set():
+                    logger.error(f"{name} stage failed: {e}")
+                    self._errors.append(e)
+                    self._failed.set()
+                return
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and out_q is not None:
+                self._put(out_q, _DONE)
+
+        threads = [threading.Thread(target=run, name=f"ingest-{name}-{i}", daemon=True) for i in range(n_workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    # -- stages -----------------------------------------------------------
+
+    def _load(self, works: Dict[str, FileWork], out_q: queue.Queue):
+        paths = [os.path.join(self.source_dir, key) for key in works]
+        # Files come back in completion order; closing the generator on abort shuts its PDF pool down
+        files = self.loader.iter_files(paths, max_workers=self.load_workers)
+        try:
+            for source, docs in files:
+                work = works[source]
+                work.docs = docs
+                self._count(docs=len(docs))
+                self._put(out_q, work)
+        finally:
+            files.close()
+
+    def _chunk(self, in_q: queue.Queue, out_q: queue.Queue):
+        while True:
+            work = self._get(in_q)
+            if work is _DONE:
+                self._put(in_q, _DONE)
+                return
+            work.chunks = self.indexer.chunk(work.key, work.docs)
+            work.docs = []
+            self._count(chunks=len(work.chunks))
+            self._put(out_q, work)
+
+    def _dedupe(self, in_q: queue.Queue, out_q: queue.Queue):
+        while True:
+            work = self._get(in_q)
+            if work is _DONE:
+                return
+            before = len(work.chunks)
+            work = self._near_dedupe(work) if self.near_dedup is not None else self.dedupe_fn(work)
+            # Only chunks that are not already indexed go on to be embedded and upserted
+            work.upserts, work.stale_ids, unchanged = self.indexer.plan(work.chunks, work.previous_ids, work.references)
+            self._count(chunks_deduplicated=before - len(work.chunks), chunks_unchanged=unchanged)
+            self._put(out_q, work)
+
+    def _near_dedupe(self, work: FileWork) -> FileWork:
+        """
+        Collapse the file's chunks onto canonical chunks anywhere in the corpus.
+        A duplicate of another file's chunk is recorded as a reference (kept
+        in the manifest, not re-indexed) and that chunk's "sources" metadata
+        is patched to include this file.
+        """
+        dedup = self.near_dedup
+        # The file's previous chunks must not act as canonical for its own new version
+        for chunk_id in work.previous_ids:
+            if not dedup.discard_source(chunk_id, work.key):
+                dedup.remove([chunk_id])
+        kept, kept_ids = [], set()
+        for chunk in work.chunks:
+            canonical = dedup.match(chunk)
+            if canonical is None:
+                kept.append(chunk)
+                kept_ids.add(chunk["id"])
+            elif canonical not in kept_ids and canonical not in work.references:
+                work.references.append(canonical)
+        work.shared_ids = sorted(set(work.references) | (work.previous_ids - kept_ids))
+        work.chunks = kept
+        return work
+
+    def _embed(self, in_q: queue.Queue, out_q: queue.Queue):
+        finished = False
+        while not finished:
+            # Gather whole files until a full batch is pending or the queue runs dry.
+            group, pending = [], 0
+            while pending < self.embed_batch_size:
+                try:
+                    work = self._get(in_q, timeout=None if not group else 0.05)
+                except queue.Empty:
+                    break
+                if work is _DONE:
+                    self._put(in_q, _DONE)
+                    finished = True
+                    break
+                group.append(work)
+                pending += sum(1 for chunk in work.upserts if chunk.get("embedding") is None)
+
+            todo = [chunk for work in group for chunk in work.upserts if chunk.get("embedding") is None]
+            for start in range(0, len(todo), self.embed_batch_size):
+                batch = todo[start:start + self.embed_batch_size]
+                texts = [chunk["text"] for chunk in batch]
+                vectors = retry_call(lambda: self.embeddings.embed_documents(texts))
+                for chunk, vector in zip(batch, vectors):
+                    chunk["embedding"] = vector
+                self._count(chunks_embedded=len(batch), embed_tokens=sum(count_tokens(text) for text in texts))
+            for work in group:
+                self._put(out_q, work)
+
+    def _upsert(self, in_q: queue.Queue, removed: List[str]):
+        # Canonical chunks whose "sources" must be refreshed, kept until their own file is upserted
+        pending_sources: Set[str] = set()
+        stale = []
+        for key in removed:
+            for doc_id in self.manifest.forget(key):
+                stale.append(doc_id)
+                if self.near_dedup is not None:
+                    self.near_dedup.discard_source(doc_id, key)
+                    pending_sources.add(doc_id)
+        deleted = self._delete_unreferenced(stale)
+        pending_sources = self._refresh_sources(pending_sources)
+        self._count(chunks_deleted=deleted, files_removed=len(removed))
+        since_checkpoint, last_checkpoint = 0, time.monotonic()
+        while True:
+            work = self._get(in_q)
+            if work is _DONE:
+                break
+            self.manifest.record(work.key, work.fingerprint, [chunk["id"] for chunk in work.chunks] + work.references)
+            deleted = self._delete_unreferenced(work.stale_ids)
+            if self.near_dedup is not None:
+                for chunk in work.upserts:
+                    chunk["metadata"]["sources"] = self.near_dedup.sources(chunk["id"])
+            for index in self.indexes:
+                if work.upserts:
+                    index.add_documents(work.upserts)
+            pending_sources = self._refresh_sources(pending_sources.union(work.shared_ids))
+            self._count(files=1, chunks_upserted=len(work.upserts), chunks_deleted=deleted)
+            since_checkpoint += 1
+            if since_checkpoint >= self.checkpoint_every or time.monotonic() - last_checkpoint >= self.checkpoint_seconds:
+                self._save_checkpoint()
+                since_checkpoint, last_checkpoint = 0, time.monotonic()
+        self._save_checkpoint()
+
+    def _delete_unreferenced(self, ids: List[str]) -> int:
+        """Delete ids no file lists any more; near-dedup canonicals shared with other files stay."""
+        # The dedupe stage runs ahead of this one, so the filter also knows about files still in flight
+        ids = [
+            doc_id for doc_id in ids
+            if self.manifest.ref_count(doc_id) == 0 and not (self.near_dedup is not None and self.near_dedup.sources(doc_id))
+        ]
+        if ids:
+            for index in self.indexes:
+                index.delete(ids)
+            if self.near_dedup is not None:
+                self.near_dedup.remove(ids)
+        return len(ids)
+
+    def _refresh_sources(self, ids: Set[str]) -> Set[str]:
+        """
+        Set "sources" metadata from the filter's current view (files may reach
+        this stage out of order); returns the ids whose chunk is not indexed yet.
+        """
+        pending = set()
+        for doc_id in ids:
+            sources = self.near_dedup.sources(doc_id)
+            if sources and not all([index.update_metadata(doc_id, {"sources": sources}) for index in self.indexes]):
+                pending.add(doc_id)
+        return pending
+
+    def _save_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint()
+        self.manifest.save()  # after the indexes, so the manifest never claims unsaved work
+        self._count(checkpoints=1)
+
+    # -- driver -----------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        stats["elapsed_s"] = round(elapsed, 2)
+        stats["docs_per_s"] = round(stats["docs"] / elapsed, 2)
+        stats["chunks_per_s"] = round(stats["chunks"] / elapsed, 2)
+        stats["embed_tokens_per_s"] = round(stats["embed_tokens"] / elapsed, 2)
+        if self.near_dedup is not None:
+            stats["near_dedup"] = self.near_dedup.report()
+        return stats
+
+    def run(self) -> Dict[str, Any]:
+        changed, removed = self.indexer.changes(self.manifest)
+        self.stats = dict.fromkeys(
+            ["files", "files_removed", "docs", "chunks", "chunks_deduplicated", "chunks_unchanged",
+             "chunks_embedded", "embed_tokens", "chunks_upserted", "chunks_deleted", "checkpoints"], 0
+        )
+        self.stats["files_total"] = len(changed)
+        self._started = time.monotonic()
+
+        works = {key: FileWork(key, fingerprint, set(self.manifest.chunk_ids(key))) for key, fingerprint in changed}
+        loaded_q, chunked_q, deduped_q, embedded_q = (queue.Queue(maxsize=self.queue_size) for _ in range(4))
+        threads = (
+            self._stage("load", 1, lambda: self._load(works, loaded_q), loaded_q)
+            + self._stage("chunk", self.chunk_workers, lambda: self._chunk(loaded_q, chunked_q), chunked_q)
+            + self._stage("dedupe", 1, lambda: self._dedupe(chunked_q, deduped_q), deduped_q)
+            + self._stage("embed", self.embed_workers, lambda: self._embed(deduped_q, embedded_q), embedded_q)
+            + self._stage("upsert", 1, lambda: self._upsert(embedded_q, removed), None)
+        )
+
+        last_report = time.monotonic()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+                if self.report_seconds and time.monotonic() - last_report >= self.report_seconds:
+                    self._print_progress()
+                    last_report = time.monotonic()
+        if self._errors:
+            raise self._errors[0]
+        return self.report()
+
+    def _print_progress(self):
+        r = self.report()
+        print(f"[ingest] files {r['files']}/{r['files_total']} | {r['docs_per_s']} docs/s | "
+              f"{r['chunks_per_s']} chunks/s | {r['embed_tokens_per_s']} embed tokens/s | "
+              f"{r['chunks_upserted']} upserted, {r['chunks_deleted']} deleted")
+
+
+def main(argv: Optional[List[str]] = None):
+    from dotenv import load_dotenv
+    from rag.retrieval.vector_store import InMemoryVectorStore, PineconeVectorStore, default_embeddings
+    from rag.retrieval.ivf_store import IVFVectorStore, IVF_FILE
+    from rag.retrieval.embedding_cache import CachedEmbeddings
+    from rag.retrieval.bm25_index import BM25Index
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Incrementally index a document directory for RAG.")
+    parser.add_argument("--source-dir", default="data/documents/raw")
+    parser.add_argument("--index-path", default=os.getenv("RAG_INDEX_PATH"),
+                        help="Local vector snapshot directory; Pinecone is used if unset")
+    parser.add_argument("--pinecone-index", default="ecommerce-rag")
+    parser.add_argument("--ivf", action="store_true",
+                        help="Partition the local snapshot into IVF cells (writes ivf.npz); the API then probes only "
+                             "RAG_IVF_NPROBE cells per query instead of scanning every vector")
+    parser.add_argument("--ivf-nlist", type=int, default=None, help="IVF cells (default 4 * sqrt(rows))")
+    parser.add_argument("--ivf-min-train-size", type=int, default=10000,
+                        help="Rows needed before the IVF cells are trained; smaller indexes stay exact")
+    parser.add_argument("--keyword-index-path", default=os.getenv("RAG_KEYWORD_INDEX_PATH", "data/index/bm25"))
+    parser.add_argument("--manifest", default=os.getenv("RAG_MANIFEST_PATH", "data/index/manifest.json"))
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--length-unit", choices=["chars", "tokens"], default="chars",
+                        help="Unit of --chunk-size / --chunk-overlap")
+    parser.add_argument("--chunk-processes", type=int, default=1, help="Processes splitting text for the chunk stage")
+    parser.add_argument("--load-workers", type=int, default=4)
+    parser.add_argument("--chunk-workers", type=int, default=2)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="Files between checkpoints")
+    parser.add_argument("--near-dedup-threshold", type=float, default=None,
+                        help="Collapse chunks with estimated Jaccard similarity >= this onto one canonical chunk")
+    parser.add_argument("--dedup-state-path", default=os.getenv("RAG_DEDUP_STATE_PATH", "data/index/dedup"))
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and re-index everything")
+    args = parser.parse_args(argv)
+    if args.ivf and not args.index_path:
+        parser.error("--ivf needs a local snapshot (--index-path)")
+
+    # Unchanged chunk texts are served from the on-disk embedding cache instead of the API.
+    embeddings = CachedEmbeddings(default_embeddings())
+    manifest = IngestionManifest.load(args.manifest)
+    local_indexes = [args.keyword_index_path] + ([args.index_path] if args.index_path else [])
+    if args.near_dedup_threshold is not None:
+        local_indexes.append(args.dedup_state_path)
+    if args.rebuild or not all(os.path.isdir(path) for path in local_indexes):
+        manifest = IngestionManifest(args.manifest)  # a local index is missing: rebuild everything
+
+    if args.index_path:
+        # Local snapshot served memory-mapped by the API (see api/app/routes.py)
+        store_cls, store_kwargs = InMemoryVectorStore, {"embeddings": embeddings}
+        if args.ivf:
+            store_cls = IVFVectorStore
+            store_kwargs.update(nlist=args.ivf_nlist, min_train_size=args.ivf_min_train_size)
+        if manifest.files:
+            store = store_cls.load(args.index_path, mmap=False, **store_kwargs)
+        else:
+            store = store_cls(**store_kwargs)
+        if args.ivf and not store.is_trained and len(store) >= args.ivf_min_train_size:
+            store.train()  # an existing exact snapshot being switched to IVF
+    else:
+        store = PineconeVectorStore(index_name=args.pinecone_index, embeddings=embeddings, upsert_batch_size=100)
+    # Keyword side of hybrid retrieval, built once here instead of per request
+    keyword_index = BM25Index.load(args.keyword_index_path) if manifest.files else BM25Index()
+    near_dedup = None
+    if args.near_dedup_threshold is not None:
+        near_dedup = NearDuplicateFilter.load(args.dedup_state_path) if manifest.files else NearDuplicateFilter(threshold=args.near_dedup_threshold)
+
+    def checkpoint():
+        if args.index_path:
+            store.save(args.index_path)
+        keyword_index.save(args.keyword_index_path)
+        if near_dedup is not None:
+            near_dedup.save(args.dedup_state_path)
+
+    chunker = DocumentChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                              length_unit=args.length_unit, max_workers=args.chunk_processes)
+    pipeline = IngestionPipeline(
+        args.source_dir, [store, keyword_index], embeddings, manifest, checkpoint=checkpoint,
+        chunker=chunker,
+        load_workers=args.load_workers, chunk_workers=args.chunk_workers, embed_workers=args.embed_workers,
+        embed_batch_size=args.embed_batch_size, queue_size=args.queue_size, checkpoint_every=args.checkpoint_every,
+        near_dedup=near_dedup
+    )
+    try:
+        print("Index update:", pipeline.run())
+    finally:
+        chunker.close()
+    if args.ivf and store.is_trained and not os.path.exists(os.path.join(args.index_path, IVF_FILE)):
+        store.save(args.index_path)  # trained above, but no file changed to trigger a checkpoint
+    print("Embedding cache:", embeddings.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Batched, concurrent embedding of document chunks for vector store ingestion.
+"""
+from typing import List, Dict, Any, Iterator, Tuple, Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def retry_call(fn: Callable[[], T], max_retries: int = 3, backoff: float = 1.0) -> T:
+    """Call `fn`, retrying up to `max_retries` times with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            logger.warning(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class BatchEmbedder:
+    """
+    Embeds docs in fixed-size batches via `embed_documents`, keeping at most
+    `max_workers` batches in flight. Batches are yielded as they complete, so
+    callers can upsert while later batches are still embedding. A failed batch
+    is retried on its own; batches that already succeeded are never redone.
+    Docs that already carry an "embedding" are passed through untouched.
+    """
+    def __init__(self, embeddings, batch_size: int = 64, max_workers: int = 4, max_retries: int = 3, retry_backoff: float = 1.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def _embed(self, batch: List[Dict[str, Any]], attempt: int) -> List[List[float]]:
+        if attempt:
+            time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+        return self.embeddings.embed_documents([doc["text"] for doc in batch])
+
+    def iter_embedded(self, docs: List[Dict[str, Any]]) -> Iterator[Tuple[List[Dict[str, Any]], List[List[float]]]]:
+        """Yield (batch, vectors) pairs in completion order."""
+        ready = [doc for doc in docs if doc.get("embedding") is not None]
+        if ready:
+            yield ready, [doc["embedding"] for doc in ready]
+
+        todo = [doc for doc in docs if doc.get("embedding") is None]
+        batches = [todo[i:i + self.batch_size] for i in range(0, len(todo), self.batch_size)]
+        if not batches:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = {}
+            next_batch = 0
+            while next_batch < len(batches) or in_flight:
+                while next_batch < len(batches) and len(in_flight) < self.max_workers:
+                    batch = batches[next_batch]
+                    in_flight[pool.submit(self._embed, batch, 0)] = (batch, 0)
+                    next_batch += 1
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, attempt = in_flight.pop(future)
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        if attempt >= self.max_retries:
+                            raise
+                        logger.warning(f"Embedding batch of {len(batch)} failed ({e}), retry {attempt + 1}")
+                        in_flight[pool.submit(self._embed, batch, attempt + 1)] = (batch, attempt + 1)
+                        continue
+                    yield batch, vectors
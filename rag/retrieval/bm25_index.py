@@ -0,0 +1,223 @@
+"""
+Persistent BM25 inverted index for keyword retrieval alongside the dense vector store.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import os
+import re
+import threading
+import numpy as np
+from rag.retrieval.vector_store import MetadataIndex, top_k_indices
+
+BM25_RECORDS_FILE = "bm25_records.json"
+BM25_POSTINGS_FILE = "bm25_postings.npz"
+
+# Words plus SKU-like compounds ("prod-001", "s21", "v2.1") kept whole
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_PART_RE = re.compile(r"[-_.]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound tokens also emit their parts so "PROD-001" matches "prod 001"."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if _PART_RE.search(token):
+            tokens.extend(part for part in _PART_RE.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index built at ingestion time. Each term maps
+    to parallel (row, term frequency) arrays; IDF values and the average
+    document length are recomputed once after a batch of updates rather than
+    per query. Documents are upserted by id like the vector stores, and the
+    index persists to a directory via `save` / `load`.
+
+    Results carry "keyword_score" (unbounded BM25) rather than "score", so
+    they are not mistaken for cosine similarities after fusion.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._doc_lengths: List[int] = []
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._pending: Dict[str, List[Tuple[int, int]]] = {}
+        self._idf: Dict[str, float] = {}
+        self._lengths = np.empty(0, dtype=np.float32)
+        self._avgdl = 0.0
+        self._dirty = False
+        self._finalize_lock = threading.Lock()  # queries from several keyword-search threads share one merge
+        self._metadata_index: Optional[MetadataIndex] = None  # built on the first filtered query
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def add_documents(self, docs: List[Dict[str, Any]]):
+        for doc in docs:
+            row = self._id_to_row.get(doc["id"])
+            if row is None:
+                row = len(self.ids)
+                self._id_to_row[doc["id"]] = row
+                self.ids.append(doc["id"])
+                self.texts.append(doc["text"])
+                self.metadatas.append(doc.get("metadata", {}))
+                self._doc_lengths.append(0)
+            else:
+                self._remove_postings(row)
+                if self._metadata_index is not None:
+                    self._metadata_index.remove(row, self.metadatas[row])
+                self.texts[row] = doc["text"]
+                self.metadatas[row] = doc.get("metadata", {})
+            if self._metadata_index is not None:
+                self._metadata_index.add(row, self.metadatas[row])
+
+            tokens = tokenize(doc["text"])
+            self._doc_lengths[row] = len(tokens)
+            terms, counts = np.unique(tokens, return_counts=True)
+            for term, count in zip(terms.tolist(), counts.tolist()):
+                self._pending.setdefault(term, []).append((row, count))
+        self._dirty = True
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Remove `ids` and return how many were removed. Deleted rows are left as
+        tombstones (id None, no postings) so surviving row numbers never move.
+        """
+        removed = 0
+        for doc_id in ids:
+            row = self._id_to_row.pop(doc_id, None)
+            if row is None:
+                continue
+            self._remove_postings(row)
+            if self._metadata_index is not None:
+                self._metadata_index.remove(row, self.metadatas[row])
+            self.ids[row] = None
+            self.texts[row] = ""
+            self.metadatas[row] = {}
+            removed += 1
+        return removed
+
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]) -> bool:
+        row = self._id_to_row.get(doc_id)
+        if row is None:
+            return False
+        if self._metadata_index is not None:
+            self._metadata_index.remove(row, self.metadatas[row])
+        self.metadatas[row] = {**self.metadatas[row], **metadata}
+        if self._metadata_index is not None:
+            self._metadata_index.add(row, self.metadatas[row])
+        return True
+
+    def _remove_postings(self, row: int):
+        for term in set(tokenize(self.texts[row])):
+            if term in self._postings:
+                rows, tfs = self._postings[term]
+                keep = rows != row
+                self._postings[term] = (rows[keep], tfs[keep])
+            if term in self._pending:
+                self._pending[term] = [p for p in self._pending[term] if p[0] != row]
+        self._doc_lengths[row] = 0
+        self._dirty = True
+
+    def _finalize(self):
+        """Merge pending postings and recompute IDF / average document length."""
+        for term, entries in self._pending.items():
+            new_rows = np.fromiter((r for r, _ in entries), dtype=np.int32, count=len(entries))
+            new_tfs = np.fromiter((c for _, c in entries), dtype=np.float32, count=len(entries))
+            if term in self._postings:
+                rows, tfs = self._postings[term]
+                new_rows, new_tfs = np.concatenate([rows, new_rows]), np.concatenate([tfs, new_tfs])
+            self._postings[term] = (new_rows, new_tfs)
+        self._pending = {}
+        self._postings = {term: p for term, p in self._postings.items() if len(p[0])}
+
+        n_docs = len(self)
+        self._lengths = np.asarray(self._doc_lengths, dtype=np.float32)
+        self._avgdl = float(self._lengths.sum() / n_docs) if n_docs else 0.0
+        df = np.fromiter((len(p[0]) for p in self._postings.values()), dtype=np.float64, count=len(self._postings))
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        self._idf = dict(zip(self._postings.keys(), idf.tolist()))
+        self._dirty = False
+
+    def _ensure_finalized(self):
+        if self._dirty:
+            with self._finalize_lock:
+                if self._dirty:  # another thread may have merged while we waited
+                    self._finalize()
+
+    def query(self, text: str, top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """BM25 top-k; `filter` uses the same metadata syntax as VectorStore.query."""
+        self._ensure_finalized()
+        if not self._postings:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self._lengths / max(self._avgdl, 1e-8))
+        for term in set(tokenize(text)):
+            if term not in self._postings:
+                continue
+            rows, tfs = self._postings[term]
+            scores[rows] += self._idf[term] * tfs * (self.k1 + 1) / (tfs + norm[rows])
+        if filter:
+            index = self._metadata_index
+            if index is None:
+                # Built fully before it is published, so concurrent queries never see a partial index
+                index = MetadataIndex()
+                for row, metadata in enumerate(self.metadatas):
+                    index.add(row, metadata)
+                self._metadata_index = index
+            allowed = np.zeros(len(scores), dtype=bool)
+            allowed[index.rows(filter)] = True
+            scores[~allowed] = 0.0
+        top = [row for row in top_k_indices(scores, top_k) if scores[row] > 0]
+        return [
+            {"id": self.ids[row], "keyword_score": float(scores[row]), "text": self.texts[row], "metadata": self.metadatas[row]}
+            for row in top
+        ]
+
+    def save(self, path: str):
+        self._ensure_finalized()
+        os.makedirs(path, exist_ok=True)
+        terms = list(self._postings.keys())
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self._postings[t][0]) for t in terms])
+        postings_path = os.path.join(path, BM25_POSTINGS_FILE)
+        with open(postings_path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                offsets=offsets,
+                rows=np.concatenate([self._postings[t][0] for t in terms]) if terms else np.empty(0, dtype=np.int32),
+                tfs=np.concatenate([self._postings[t][1] for t in terms]) if terms else np.empty(0, dtype=np.float32),
+                doc_lengths=np.asarray(self._doc_lengths, dtype=np.int32)
+            )
+        os.replace(postings_path + ".tmp", postings_path)
+
+        records_path = os.path.join(path, BM25_RECORDS_FILE)
+        records = {"k1": self.k1, "b": self.b, "terms": terms, "ids": self.ids, "texts": self.texts, "metadatas": self.metadatas}
+        with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(records_path + ".tmp", records_path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(os.path.join(path, BM25_RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        index = cls(k1=records["k1"], b=records["b"])
+        index.ids = records["ids"]
+        index.texts = records["texts"]
+        index.metadatas = records["metadatas"]
+        index._id_to_row = {doc_id: row for row, doc_id in enumerate(index.ids) if doc_id is not None}
+        with np.load(os.path.join(path, BM25_POSTINGS_FILE)) as data:
+            offsets, rows, tfs = data["offsets"], data["rows"], data["tfs"]
+            index._doc_lengths = data["doc_lengths"].tolist()
+        index._postings = {
+            term: (rows[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+            for i, term in enumerate(records["terms"])
+        }
+        index._finalize()
+        return index
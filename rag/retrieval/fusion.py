@@ -0,0 +1,28 @@
+"""
+Rank fusion for combining result lists from different retrievers.
+"""
+from typing import List, Dict, Any
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60, top_k: int = None) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by id with reciprocal rank fusion:
+    fusion_score(d) = sum over lists of 1 / (k + rank of d in that list).
+
+    Each fused doc is a copy of its first occurrence (so earlier lists win
+    when fields clash) with the other lists' fields filled in, plus
+    "fusion_score". Only ranks are used, so lists with incomparable score
+    scales (cosine vs. BM25) can be fused directly.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            entry = fused.get(doc["id"])
+            if entry is None:
+                entry = fused[doc["id"]] = {**doc, "fusion_score": 0.0}
+            else:
+                for key, value in doc.items():
+                    entry.setdefault(key, value)
+            entry["fusion_score"] += 1.0 / (k + rank + 1)
+    ranked = sorted(fused.values(), key=lambda d: d["fusion_score"], reverse=True)
+    return ranked[:top_k] if top_k is not None else ranked
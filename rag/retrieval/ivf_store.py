@@ -0,0 +1,185 @@
+"""
+Approximate nearest-neighbour vector store using an inverted file (IVF) index.
+"""
+from typing import List, Dict, Any, Optional, Sequence
+import logging
+import os
+import numpy as np
+from rag.retrieval.vector_store import InMemoryVectorStore, normalize, top_k_indices
+
+IVF_FILE = "ivf.npz"
+
+logger = logging.getLogger(__name__)
+
+# Rows are assigned to centroids in blocks of this size to bound temporary memory.
+_ASSIGN_BLOCK = 65536
+
+
+def spherical_kmeans(sample: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """K-means on unit vectors using cosine similarity; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        if empty.any():
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFVectorStore(InMemoryVectorStore):
+    """
+    Partitions the normalized embedding matrix into `nlist` cosine k-means
+    cells and, at query time, scores only the rows in the `nprobe` cells whose
+    centroids are closest to the query. Raising `nprobe` trades speed for
+    recall; `nprobe == nlist` is an exact search.
+
+    Until the store holds `min_train_size` rows it behaves exactly like
+    InMemoryVectorStore; it then trains itself once, and later adds are
+    assigned to their nearest existing centroid. Call `train()` again to
+    rebalance after heavy growth. The centroids and cell assignments are
+    persisted alongside the base snapshot by `save` / `load`.
+    """
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, min_train_size: int = 10000,
+                 max_train_sample: int = 100000, **kwargs):
+        super().__init__(**kwargs)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.max_train_sample = max_train_sample
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int32)  # cell id per row
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}  # cached np views of _lists, invalidated on change
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, n_iter: int = 20, seed: int = 0):
+        """Fit cell centroids on (a sample of) the stored rows and assign every row to a cell."""
+        n = len(self)
+        if n == 0:
+            raise ValueError("Cannot train an empty index")
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, size=min(n, self.max_train_sample), replace=False))
+        self.centroids = spherical_kmeans(np.asarray(self.matrix[sample_rows]), nlist, n_iter=n_iter, seed=seed)
+        self.nlist = nlist
+        self._assignments = self._assign(np.arange(n))
+        self._rebuild_lists()
+
+    def _assign(self, rows: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), _ASSIGN_BLOCK):
+            block = rows[start:start + _ASSIGN_BLOCK]
+            labels[start:start + _ASSIGN_BLOCK] = np.argmax(self.matrix[block] @ self.centroids.T, axis=1)
+        return labels
+
+    def _rebuild_lists(self):
+        order = np.argsort(self._assignments, kind="stable")
+        bounds = np.searchsorted(self._assignments[order], np.arange(self.nlist + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]].tolist() for c in range(self.nlist)]
+        self._list_arrays = {}
+
+    def _upsert(self, docs: Sequence[Dict[str, Any]], rows: np.ndarray) -> np.ndarray:
+        previous_size = len(self)
+        targets = super()._upsert(docs, rows)
+        if not self.is_trained:
+            if len(self) >= self.min_train_size:
+                self.train()
+            return targets
+
+        if len(self) > previous_size:
+            self._assignments = np.concatenate(
+                [self._assignments, np.full(len(self) - previous_size, -1, dtype=np.int32)]
+            )
+        labels = self._assign(targets)
+        for row, label in zip(targets.tolist(), labels.tolist()):
+            old = self._assignments[row]
+            if old == label:
+                continue
+            if old >= 0:
+                self._lists[old].remove(row)
+                self._list_arrays.pop(old, None)
+            self._lists[label].append(row)
+            self._list_arrays.pop(label, None)
+            self._assignments[row] = label
+        return targets
+
+    def _remove_row(self, row: int, last: int):
+        if not self.is_trained:
+            return
+        cell = self._assignments[row]
+        self._lists[cell].remove(row)
+        self._list_arrays.pop(cell, None)
+        if row != last:
+            moved = self._assignments[last]
+            self._lists[moved][self._lists[moved].index(last)] = row
+            self._list_arrays.pop(moved, None)
+            self._assignments[row] = moved
+        self._assignments = self._assignments[:last]
+
+    def _cell(self, cell: int) -> np.ndarray:
+        arr = self._list_arrays.get(cell)
+        if arr is None:
+            arr = np.asarray(self._lists[cell], dtype=np.int64)
+            self._list_arrays[cell] = arr
+        return arr
+
+    def query(self, query_embedding: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        if not self.is_trained or filter:
+            # Filtered subsets are scored exactly; they are small enough that probing would only lose recall.
+            return super().query(query_embedding, top_k=top_k, filter=filter)
+        q = normalize(query_embedding)[0]
+        probe = top_k_indices(self.centroids @ q, self.nprobe)
+        rows = np.concatenate([self._cell(c) for c in probe.tolist()])
+        if len(rows) == 0:
+            return []
+        scores = self.matrix[rows] @ q
+        return [self._result(rows[i], scores[i]) for i in top_k_indices(scores, top_k)]
+
+    def query_batch(self, query_embeddings: List[List[float]], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        if not self.is_trained or filter:
+            return super().query_batch(query_embeddings, top_k=top_k, filter=filter)
+        # Each query probes its own cells, so there is no shared GEMM to exploit.
+        return [self.query(embedding, top_k=top_k) for embedding in query_embeddings]
+
+    def _save_extra(self, path: str):
+        if not self.is_trained:
+            return
+        tmp_path = os.path.join(path, IVF_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self._assignments[:len(self)],
+                     snapshot_id=np.array(self.snapshot_id or ""))
+        os.replace(tmp_path, os.path.join(path, IVF_FILE))
+
+    def _load_extra(self, path: str, mmap: bool):
+        ivf_path = os.path.join(path, IVF_FILE)
+        if not os.path.exists(ivf_path):
+            return
+        with np.load(ivf_path) as data:
+            centroids = data["centroids"]
+            assignments = data["assignments"].astype(np.int32)
+            snapshot_id = (str(data["snapshot_id"]) or None) if "snapshot_id" in data.files else None
+        if len(self) == 0:
+            return
+        if centroids.shape[1] != self.matrix.shape[1]:
+            logger.warning(f"{ivf_path} does not match the snapshot's embedding dimension; retraining")
+            if len(self) >= self.min_train_size:
+                self.train()
+            return
+        self.centroids = centroids
+        self.nlist = len(centroids)
+        if snapshot_id != self.snapshot_id or len(assignments) != len(self):
+            # Left behind by an older snapshot (e.g. one rewritten by a plain InMemoryVectorStore).
+            # Its centroids still partition the embedding space, so only the rows are reassigned.
+            logger.warning(f"{ivf_path} was written for a different snapshot; reassigning rows to its cells")
+            assignments = self._assign(np.arange(len(self)))
+        self._assignments = assignments
+        self._rebuild_lists()
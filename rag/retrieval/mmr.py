@@ -0,0 +1,36 @@
+"""
+Maximal marginal relevance (MMR) selection over candidate embeddings.
+"""
+from typing import List
+import numpy as np
+from rag.retrieval.vector_store import normalize
+
+
+def mmr_select(query_embedding: List[float], candidate_embeddings: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Greedily pick `k` candidate indices maximizing
+    lambda * sim(query, c) - (1 - lambda) * max(sim(c, already selected)).
+
+    The candidate-candidate similarity matrix is computed once; each greedy
+    step is then a single vectorized update, so selection is O(k * n) after
+    the O(n^2 * d) product. lambda_mult=1 reduces to plain relevance ranking.
+    """
+    n = len(candidate_embeddings)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    candidates = normalize(candidate_embeddings)
+    relevance = candidates @ normalize(query_embedding)[0]
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()  # max similarity to anything selected so far
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
@@ -0,0 +1,136 @@
+"""
+Int8 scalar-quantized vector store with full-precision re-scoring.
+"""
+from typing import List, Dict, Any, Optional, Sequence
+import json
+import logging
+import os
+import numpy as np
+from rag.retrieval.vector_store import InMemoryVectorStore, GROWTH_CHUNK, normalize, top_k_indices, top_k_rows
+
+CODES_FILE = "codes_int8.npy"
+SCALES_FILE = "scales.npy"
+CODES_META_FILE = "codes_int8.json"  # snapshot the codes were written for
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the float32 temporary created when decoding a block of codes.
+_DECODE_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def quantize_int8(rows: np.ndarray):
+    """Symmetric per-row int8 quantization; returns (codes, scales) with rows ~= codes * scales."""
+    scales = np.abs(rows).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(rows / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedVectorStore(InMemoryVectorStore):
+    """
+    Searches int8 codes (1 byte per dimension instead of 4) and re-scores the
+    best `top_k * rescore_factor` candidates against the full-precision rows.
+
+    The intended deployment is build -> `save` -> `load(mmap=True)`: the codes
+    are loaded into RAM while the float32 matrix stays memory-mapped, so only
+    the re-scored shortlist rows are ever paged in. Measure the recall impact
+    on your own corpus with rag/evaluation/index_benchmark.py.
+    """
+    def __init__(self, rescore_factor: int = 4, min_rescore: int = 32, **kwargs):
+        super().__init__(**kwargs)
+        self.rescore_factor = rescore_factor
+        self.min_rescore = min_rescore
+        self._codes = None  # (capacity, dim) int8
+        self._scales = np.empty(0, dtype=np.float32)
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[:len(self)]
+
+    def _upsert(self, docs: Sequence[Dict[str, Any]], rows: np.ndarray) -> np.ndarray:
+        targets = super()._upsert(docs, rows)
+        if self._codes is None:
+            self._codes = np.empty((max(GROWTH_CHUNK, len(self)), rows.shape[1]), dtype=np.int8)
+            self._scales = np.empty(self._codes.shape[0], dtype=np.float32)
+        elif len(self) > self._codes.shape[0]:
+            capacity = max(len(self), self._codes.shape[0] + max(GROWTH_CHUNK, self._codes.shape[0] // 2))
+            codes = np.empty((capacity, self._codes.shape[1]), dtype=np.int8)
+            codes[:self._codes.shape[0]] = self._codes
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:self._scales.shape[0]] = self._scales
+            self._codes, self._scales = codes, scales
+        self._codes[targets], self._scales[targets] = quantize_int8(rows)
+        return targets
+
+    def _remove_row(self, row: int, last: int):
+        if row != last:
+            self._codes[row], self._scales[row] = self._codes[last], self._scales[last]
+
+    def _shortlist(self, queries: np.ndarray, size: int) -> np.ndarray:
+        """Approximate top-`size` rows per query from the int8 codes, scanned block-wise."""
+        n, dim = len(self), self._codes.shape[1]
+        block = max(1024, _DECODE_BLOCK_BYTES // (4 * dim))
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, n, block):
+            stop = min(n, start + block)
+            scores = (queries @ self._codes[start:stop].astype(np.float32).T) * self._scales[start:stop]
+            rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            keep = top_k_rows(best_scores, size)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        return best_rows
+
+    def query_batch(self, query_embeddings: List[List[float]], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        if filter:
+            # Filtered subsets are small: score their full-precision rows directly.
+            return super().query_batch(query_embeddings, top_k=top_k, filter=filter)
+        if len(query_embeddings) == 0:
+            return []
+        if len(self) == 0:
+            return [[] for _ in query_embeddings]
+        queries = normalize(query_embeddings)
+        shortlists = self._shortlist(queries, max(top_k * self.rescore_factor, self.min_rescore))
+        results = []
+        for q, rows in zip(queries, shortlists):
+            rows = np.sort(rows)  # sequential access into the memory-mapped matrix
+            scores = self.matrix[rows] @ q
+            results.append([self._result(rows[i], scores[i]) for i in top_k_indices(scores, top_k)])
+        return results
+
+    def query(self, query_embedding: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.query_batch([query_embedding], top_k=top_k, filter=filter)[0]
+
+    def _save_extra(self, path: str):
+        for name, array in ((CODES_FILE, self.codes if self._codes is not None else np.empty((0, 0), dtype=np.int8)),
+                            (SCALES_FILE, self._scales[:len(self)])):
+            with open(os.path.join(path, name + ".tmp"), "wb") as f:
+                np.save(f, array)
+            os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+        with open(os.path.join(path, CODES_META_FILE + ".tmp"), "w") as f:
+            json.dump({"snapshot_id": self.snapshot_id, "count": len(self)}, f)
+        os.replace(os.path.join(path, CODES_META_FILE + ".tmp"), os.path.join(path, CODES_META_FILE))
+
+    def _load_extra(self, path: str, mmap: bool):
+        if len(self) == 0:
+            return
+        codes_path, meta_path = os.path.join(path, CODES_FILE), os.path.join(path, CODES_META_FILE)
+        if os.path.exists(codes_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            codes = np.load(codes_path)
+            scales = np.load(os.path.join(path, SCALES_FILE))
+            if meta.get("snapshot_id") == self.snapshot_id and codes.shape == self.matrix.shape and len(scales) == len(self):
+                self._codes, self._scales = codes, scales
+                return
+            # Left behind by an older snapshot (e.g. one rewritten by a plain InMemoryVectorStore)
+            logger.warning(f"{codes_path} was written for a different snapshot; re-quantizing")
+        # Plain InMemoryVectorStore snapshot (or stale codes): quantize it block by block.
+        self._codes = np.empty(self.matrix.shape, dtype=np.int8)
+        self._scales = np.empty(len(self), dtype=np.float32)
+        block = max(1024, _DECODE_BLOCK_BYTES // (4 * self.matrix.shape[1]))
+        for start in range(0, len(self), block):
+            stop = min(len(self), start + block)
+            self._codes[start:stop], self._scales[start:stop] = quantize_int8(np.asarray(self.matrix[start:stop]))
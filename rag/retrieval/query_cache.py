@@ -0,0 +1,143 @@
+"""
+LRU + TTL cache for per-query retrieval work (HyDE text, query embeddings), with an optional Redis tier.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form, so "Where is my order? " and "where is my order?" share an entry."""
+    return " ".join(text.lower().split())
+
+
+class QueryCache:
+    """
+    Two-tier cache for values derived from a query string. Entries are keyed
+    by kind ("hyde", "embedding"), model name and a SHA-1 of the normalized
+    query text, and expire `ttl` seconds after they are written.
+
+    The in-process tier is an LRU capped at `max_entries`. If `redis_url` is
+    given (and redis is installed), values are also written to Redis as JSON
+    so every API worker shares warm entries; a Redis hit is copied into the
+    local tier. Redis errors are counted and otherwise ignored, since the
+    cache must never fail a query.
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0, redis_url: Optional[str] = None,
+                 namespace: str = "rag:query"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, int]] = {}
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                print("redis not installed. Query cache will be in-process only.")
+            else:
+                self._redis = redis.Redis.from_url(redis_url)
+
+    def _key(self, kind: str, model: str, text: str) -> str:
+        digest = hashlib.sha1(normalize_query(text).encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{kind}:{model}:{digest}"
+
+    def _count(self, kind: str, event: str, n: int = 1):
+        with self._lock:
+            counts = self._metrics.setdefault(kind, {"hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0})
+            counts[event] += n
+
+    def get(self, kind: str, model: str, text: str) -> Optional[Any]:
+        key = self._key(kind, model, text)
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._local.move_to_end(key)
+                    value = entry[1]
+                else:
+                    del self._local[key]
+                    value = None
+            else:
+                value = None
+        if value is not None:
+            self._count(kind, "hits")
+            return value
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+            except Exception:
+                raw = None
+                self._count(kind, "redis_errors")
+            if raw is not None:
+                value = json.loads(raw)
+                self._put_local(key, value)
+                self._count(kind, "redis_hits")
+                return value
+        self._count(kind, "misses")
+        return None
+
+    def set(self, kind: str, model: str, text: str, value: Any):
+        key = self._key(kind, model, text)
+        self._put_local(key, value)
+        if self._redis is not None:
+            try:
+                self._redis.set(key, json.dumps(value), ex=max(1, int(self.ttl)))
+            except Exception:
+                self._count(kind, "redis_errors")
+
+    def _put_local(self, key: str, value: Any):
+        with self._lock:
+            self._local[key] = (time.time() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get_or_compute(self, kind: str, model: str, text: str, compute: Callable[[str], Any]) -> Any:
+        value = self.get(kind, model, text)
+        if value is None:
+            value = compute(text)
+            self.set(kind, model, text, value)
+        return value
+
+    async def aget_or_compute(self, kind: str, model: str, text: str, compute: Callable[[str], Awaitable[Any]]) -> Any:
+        """`get_or_compute` for async callers; `compute` is a coroutine function."""
+        value = self.get(kind, model, text)
+        if value is None:
+            value = await compute(text)
+            self.set(kind, model, text, value)
+        return value
+
+    def get_or_compute_many(self, kind: str, model: str, texts: List[str],
+                            compute_many: Callable[[List[str]], List[Any]]) -> List[Any]:
+        """Batched `get_or_compute`: a single `compute_many` call covers every miss."""
+        values = [self.get(kind, model, text) for text in texts]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            fresh = compute_many([texts[i] for i in missing])
+            for i, value in zip(missing, fresh):
+                values[i] = value
+                self.set(kind, model, texts[i], value)
+        return values
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {kind: dict(counts) for kind, counts in self._metrics.items()}
+            entries = len(self._local)
+        for counts in metrics.values():
+            lookups = counts["hits"] + counts["redis_hits"] + counts["misses"]
+            counts["hit_rate"] = (counts["hits"] + counts["redis_hits"]) / lookups if lookups else 0.0
+        return {"entries": entries, "kinds": metrics}
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
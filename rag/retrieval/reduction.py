@@ -0,0 +1,91 @@
+"""
+Dimensionality reduction for embeddings, shared by index and query time.
+"""
+from typing import Optional
+import numpy as np
+from rag.retrieval.vector_store import normalize
+
+# Rows are projected in blocks of this size to bound temporary memory.
+_PROJECT_BLOCK = 65536
+
+
+class Reducer:
+    """Maps embeddings of the source model into a lower-dimensional space."""
+    kind = "base"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def transform(self, vectors) -> np.ndarray:
+        raise NotImplementedError
+
+    def _arrays(self) -> dict:
+        return {}
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, kind=self.kind, dim=self.dim, **self._arrays())
+
+
+class TruncationReducer(Reducer):
+    """Keeps the first `dim` components; correct for Matryoshka-trained models such as text-embedding-3-*."""
+    kind = "truncate"
+
+    def transform(self, vectors) -> np.ndarray:
+        return np.atleast_2d(np.asarray(vectors, dtype=np.float32))[:, :self.dim]
+
+
+class PCAReducer(Reducer):
+    """Projects onto the top `dim` principal components of the indexed corpus."""
+    kind = "pca"
+
+    def __init__(self, dim: int, mean: Optional[np.ndarray] = None, components: Optional[np.ndarray] = None):
+        super().__init__(dim)
+        self.mean = mean
+        self.components = components  # (source_dim, dim)
+
+    def fit(self, matrix: np.ndarray, max_samples: int = 100000, seed: int = 0) -> "PCAReducer":
+        rng = np.random.default_rng(seed)
+        if len(matrix) > max_samples:
+            matrix = matrix[np.sort(rng.choice(len(matrix), size=max_samples, replace=False))]
+        sample = np.asarray(matrix, dtype=np.float64)
+        self.mean = sample.mean(axis=0)
+        centered = sample - self.mean
+        # Eigen-decomposition of the (source_dim x source_dim) covariance is cheaper than an SVD of the sample.
+        eigvals, eigvecs = np.linalg.eigh(centered.T @ centered)
+        self.components = eigvecs[:, np.argsort(eigvals)[::-1][:self.dim]].astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+        return self
+
+    def transform(self, vectors) -> np.ndarray:
+        if self.components is None:
+            raise ValueError("PCAReducer must be fitted before use")
+        return (np.atleast_2d(np.asarray(vectors, dtype=np.float32)) - self.mean) @ self.components
+
+    def _arrays(self) -> dict:
+        return {"mean": self.mean, "components": self.components}
+
+
+def load_reducer(path: str) -> Reducer:
+    with np.load(path) as data:
+        kind, dim = str(data["kind"]), int(data["dim"])
+        if kind == TruncationReducer.kind:
+            return TruncationReducer(dim)
+        if kind == PCAReducer.kind:
+            return PCAReducer(dim, mean=data["mean"], components=data["components"])
+    raise ValueError(f"Unknown reducer kind: {kind}")
+
+
+def project_store(store, reducer: Reducer, store_cls=None, **kwargs):
+    """
+    Build a new store (of `store_cls`, default the source store's class) holding
+    `store`'s documents projected through `reducer`. The source rows are the
+    normalized full-dimension embeddings, which is what the reducers expect.
+    """
+    target = (store_cls or type(store))(reducer=reducer, **kwargs)
+    docs = [{"id": doc_id, "text": text, "metadata": metadata}
+            for doc_id, text, metadata in zip(store.ids, store.texts, store.metadatas)]
+    for start in range(0, len(store), _PROJECT_BLOCK):
+        stop = min(len(store), start + _PROJECT_BLOCK)
+        target._upsert(docs[start:stop], normalize(reducer.transform(store.matrix[start:stop])))
+    return target
@@ -0,0 +1,100 @@
+"""
+Local reranking stage with a pair-score cache.
+"""
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple
+from collections import OrderedDict
+import hashlib
+import threading
+import numpy as np
+from rag.retrieval.bm25_index import tokenize
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+
+def lexical_overlap_scores(pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+    """Fraction of query terms present in each passage; a dependency-free fallback scorer."""
+    scores = np.zeros(len(pairs), dtype=np.float32)
+    for i, (query, text) in enumerate(pairs):
+        query_terms = set(tokenize(query))
+        if query_terms:
+            scores[i] = len(query_terms & set(tokenize(text))) / len(query_terms)
+    return scores
+
+
+class Reranker:
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores every (query, chunk) pair in one batch with a local cross-encoder
+    on CPU and returns the top_k docs with a "rerank_score". Pair scores are
+    cached by hash, so candidates seen again on a retry or repeat question
+    are never scored twice. If `decisive_margin` is set and the retrieval
+    score of the first candidate beats the second by at least that much, the
+    retrieval order is kept and no scoring is done.
+
+    `scorer` maps a list of (query, text) pairs to scores; by default it is a
+    sentence-transformers CrossEncoder, falling back to lexical overlap when
+    sentence-transformers is not installed.
+    """
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 scorer: Optional[Callable[[List[Tuple[str, str]]], Sequence[float]]] = None,
+                 batch_size: int = 32, cache_size: int = 50000, decisive_margin: Optional[float] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.decisive_margin = decisive_margin
+        self._scorer = scorer
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_scorer(self):
+        if self._scorer is None:
+            if CrossEncoder is None:
+                print("sentence-transformers not installed. Falling back to lexical overlap reranking.")
+                self._scorer = lexical_overlap_scores
+            else:
+                model = CrossEncoder(self.model_name, device="cpu")
+                self._scorer = lambda pairs: model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return self._scorer
+
+    def _key(self, query: str, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{query}\0{text}".encode("utf-8")).hexdigest()
+
+    def _is_decisive(self, docs: List[Dict[str, Any]]) -> bool:
+        if self.decisive_margin is None or len(docs) < 2:
+            return False
+        first, second = docs[0].get("score"), docs[1].get("score")
+        return first is not None and second is not None and first - second >= self.decisive_margin
+
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        keys = [self._key(query, text) for text in texts]
+        scores = np.empty(len(texts), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+                else:
+                    missing.append(i)
+        if missing:
+            fresh = np.asarray(self._get_scorer()([(query, texts[i]) for i in missing]), dtype=np.float32)
+            scores[missing] = fresh
+            with self._lock:
+                for i, value in zip(missing, fresh.tolist()):
+                    self._cache[keys[i]] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        if not docs or self._is_decisive(docs):
+            return docs[:top_k]
+        scores = self.score(query, [doc.get("text", "") for doc in docs])
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [{**docs[i], "rerank_score": float(scores[i])} for i in order]
@@ -1,44 +1,273 @@
 """
-Retriever with semantic search, reranker, MMR, and HyDE support.
+Retriever with semantic search, hybrid BM25 fusion, reranker, MMR, HyDE support and query caching.
 """
 from typing import List, Dict, Any, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import logging
+import threading
+import time
+import numpy as np
 from langchain_openai import ChatOpenAI
 from rag.retrieval.vector_store import VectorStore
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import CohereRerank
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
+from rag.retrieval.bm25_index import BM25Index
+from rag.retrieval.fusion import reciprocal_rank_fusion
+from rag.retrieval.mmr import mmr_select
+from rag.retrieval.reranker import CrossEncoderReranker
+from rag.retrieval.query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
 
 class Retriever:
-    def __init__(self, vector_store: VectorStore, embed_fn, rerank_fn=None, hyde_llm=None):
+    def __init__(self, vector_store: VectorStore, embed_fn, rerank_fn=None, hyde_llm=None,
+                 keyword_index: Optional[BM25Index] = None, mmr_lambda: float = 0.5,
+                 query_cache: Optional[QueryCache] = None, hyde_timeout: float = 2.0, max_pending_hyde: int = 4):
         self.vector_store = vector_store
         self.embed_fn = embed_fn
-        self.rerank_fn = rerank_fn
+        self.rerank_fn = rerank_fn  # Reranker instance or callable(query, docs, top_k); local cross-encoder if None
         self.hyde_llm = hyde_llm if hyde_llm else ChatOpenAI(model="gpt-4o-mini")  # For HyDE
+        self.keyword_index = keyword_index  # Enables hybrid dense + BM25 retrieval with RRF
+        self.mmr_lambda = mmr_lambda  # 1.0 = pure relevance, 0.0 = pure diversity
+        self.query_cache = query_cache  # Caches HyDE text and query embeddings across calls
+        self.hyde_timeout = hyde_timeout  # Seconds concurrent HyDE may take before direct results are used alone
+        self.max_pending_hyde = max_pending_hyde  # HyDE calls allowed in flight; beyond that HyDE is skipped
+        self._executor = ThreadPoolExecutor(max_workers=4)  # keyword search
+        # HyDE calls that miss the deadline keep running, so they get their own pool and never delay keyword search
+        self._hyde_executor = ThreadPoolExecutor(max_workers=max_pending_hyde)
+        self._hyde_slots = threading.BoundedSemaphore(max_pending_hyde)
 
     def hyde_query(self, query: str) -> str:
         """Generate hypothetical document for HyDE Retrieval."""
+        if self.query_cache is not None:
+            return self.query_cache.get_or_compute("hyde", self._hyde_model, query, self._generate_hyde)
+        return self._generate_hyde(query)
+
+    def hyde_queries(self, queries: List[str]) -> List[str]:
+        """Generate hypothetical documents for several queries in one batched LLM call."""
+        if self.query_cache is not None:
+            return self.query_cache.get_or_compute_many("hyde", self._hyde_model, list(queries), self._generate_hyde_batch)
+        return self._generate_hyde_batch(queries)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is not None:
+            return self.query_cache.get_or_compute("embedding", self._embed_model, text, self.embed_fn.embed_query)
+        return self.embed_fn.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        if self.query_cache is not None:
+            return self.query_cache.get_or_compute_many("embedding", self._embed_model, list(texts), self.embed_fn.embed_documents)
+        return self.embed_fn.embed_documents(texts)
+
+    async def ahyde_query(self, query: str) -> str:
+        if self.query_cache is not None:
+            return await self.query_cache.aget_or_compute("hyde", self._hyde_model, query, self._agenerate_hyde)
+        return await self._agenerate_hyde(query)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.query_cache is not None:
+            return await self.query_cache.aget_or_compute("embedding", self._embed_model, text, self._aembed)
+        return await self._aembed(text)
+
+    def _generate_hyde(self, query: str) -> str:
         hypo_prompt = f"Write a detailed hypothetical answer to: {query}"
         return self.hyde_llm.invoke(hypo_prompt).content
 
-    def retrieve(self, query: str, top_k: int = 5, use_hyde: bool = False, use_mmr: bool = False, use_rerank: bool = False) -> List[Dict[str, Any]]:
+    def _generate_hyde_batch(self, queries: List[str]) -> List[str]:
+        hypo_prompts = [f"Write a detailed hypothetical answer to: {query}" for query in queries]
+        return [msg.content for msg in self.hyde_llm.batch(hypo_prompts)]
+
+    async def _agenerate_hyde(self, query: str) -> str:
+        if not hasattr(self.hyde_llm, "ainvoke"):
+            return await asyncio.to_thread(self._generate_hyde, query)
+        return (await self.hyde_llm.ainvoke(f"Write a detailed hypothetical answer to: {query}")).content
+
+    async def _aembed(self, text: str) -> List[float]:
+        if not hasattr(self.embed_fn, "aembed_query"):
+            return await asyncio.to_thread(self.embed_fn.embed_query, text)
+        return await self.embed_fn.aembed_query(text)
+
+    @property
+    def _hyde_model(self) -> str:
+        return getattr(self.hyde_llm, "model_name", type(self.hyde_llm).__name__)
+
+    @property
+    def _embed_model(self) -> str:
+        return getattr(self.embed_fn, "model", type(self.embed_fn).__name__)
+
+    def retrieve(self, query: str, top_k: int = 5, use_hyde: bool = False, use_mmr: bool = False, use_rerank: bool = False,
+                 filter: Optional[Dict[str, Any]] = None, concurrent_hyde: bool = False) -> List[Dict[str, Any]]:
+        """
+        `filter` restricts both dense and keyword search by metadata, e.g. {"product_id": "PROD-001"}.
+
+        With `use_hyde` and `concurrent_hyde`, the direct query is searched
+        immediately while HyDE runs in the background; its results are fused
+        in with RRF if they arrive within `hyde_timeout` seconds, otherwise
+        the direct results are used alone. While `max_pending_hyde` late HyDE
+        calls are still running, new queries skip HyDE.
+        """
+        fetch_k = 20 if (use_mmr or use_rerank) else top_k
+        # Keyword search on the raw query runs while we generate HyDE text and embed
+        keyword_future = self._submit_keyword(query, fetch_k, filter)
+        if use_hyde and concurrent_hyde:
+            return self._retrieve_concurrent_hyde(query, top_k, fetch_k, use_mmr, use_rerank, filter, keyword_future)
+
         query_text = self.hyde_query(query) if use_hyde else query
-        query_emb = self.embed_fn.embed_query(query_text)
+        query_emb = self._project([self.embed_query(query_text)])[0]
 
         # Base retrieval
-        results = self.vector_store.query(query_emb, top_k=20 if (use_mmr or use_rerank) else top_k)
+        results = self.vector_store.query(query_emb, top_k=fetch_k, filter=filter)
+        if keyword_future is not None:
+            results = reciprocal_rank_fusion([results, keyword_future.result()], top_k=fetch_k)
+        return self._postprocess(query, query_emb, results, top_k, use_mmr, use_rerank)
+
+    def _retrieve_concurrent_hyde(self, query: str, top_k: int, fetch_k: int, use_mmr: bool, use_rerank: bool,
+                                  filter: Optional[Dict[str, Any]], keyword_future) -> List[Dict[str, Any]]:
+        deadline = time.monotonic() + self.hyde_timeout
+        hyde_future = None
+        if self._acquire_hyde_slot():
+            hyde_future = self._hyde_executor.submit(self._hyde_search, query, fetch_k, filter)
+            hyde_future.add_done_callback(lambda _: self._hyde_slots.release())
+
+        query_emb = self._project([self.embed_query(query)])[0]
+        result_lists = [self.vector_store.query(query_emb, top_k=fetch_k, filter=filter)]
+        if hyde_future is not None:
+            try:
+                result_lists.append(hyde_future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                # Left running: with a query cache its HyDE text still warms the next identical query
+                logger.info(f"HyDE missed the {self.hyde_timeout:.1f}s deadline; using direct retrieval only")
+            except Exception as e:
+                logger.warning(f"HyDE retrieval failed, using direct retrieval only: {e}")
+        if keyword_future is not None:
+            result_lists.append(keyword_future.result())
+
+        results = result_lists[0] if len(result_lists) == 1 else reciprocal_rank_fusion(result_lists, top_k=fetch_k)
+        return self._postprocess(query, query_emb, results, top_k, use_mmr, use_rerank)
+
+    def _acquire_hyde_slot(self) -> bool:
+        """Reserve one of the `max_pending_hyde` HyDE slots; False when all are taken by slow calls."""
+        if self._hyde_slots.acquire(blocking=False):
+            return True
+        logger.info(f"{self.max_pending_hyde} HyDE calls still pending; using direct retrieval only")
+        return False
+
+    def _hyde_search(self, query: str, top_k: int, filter: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        hyde_emb = self._project([self.embed_query(self.hyde_query(query))])[0]
+        return self.vector_store.query(hyde_emb, top_k=top_k, filter=filter)
+
+    async def aretrieve(self, query: str, top_k: int = 5, use_hyde: bool = False, use_mmr: bool = False, use_rerank: bool = False,
+                        filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        `retrieve` for asyncio callers. The query embedding and HyDE use the
+        embedder's and LLM's async methods (aembed_query / ainvoke), so no
+        thread sits waiting on the network; store search, keyword search and
+        post-processing are CPU work and run in worker threads. HyDE always
+        runs alongside the direct query, bounded by `hyde_timeout`.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.hyde_timeout
+        fetch_k = 20 if (use_mmr or use_rerank) else top_k
+        keyword_task = None
+        if self.keyword_index is not None:
+            keyword_task = asyncio.ensure_future(asyncio.to_thread(self.keyword_index.query, query, fetch_k, filter))
+        hyde_task = None
+        if use_hyde and self._acquire_hyde_slot():
+            hyde_task = asyncio.ensure_future(self._ahyde_search(query, fetch_k, filter))
+            hyde_task.add_done_callback(self._hyde_task_done)
+
+        query_emb = self._project([await self.aembed_query(query)])[0]
+        result_lists = [await asyncio.to_thread(self.vector_store.query, query_emb, fetch_k, filter)]
+        if hyde_task is not None:
+            try:
+                # Shielded: a late HyDE result still warms the query cache for the next identical query
+                result_lists.append(await asyncio.wait_for(asyncio.shield(hyde_task), max(0.0, deadline - loop.time())))
+            except asyncio.TimeoutError:
+                logger.info(f"HyDE missed the {self.hyde_timeout:.1f}s deadline; using direct retrieval only")
+            except Exception as e:
+                logger.warning(f"HyDE retrieval failed, using direct retrieval only: {e}")
+        if keyword_task is not None:
+            result_lists.append(await keyword_task)
+
+        results = result_lists[0] if len(result_lists) == 1 else reciprocal_rank_fusion(result_lists, top_k=fetch_k)
+        return await asyncio.to_thread(self._postprocess, query, query_emb, results, top_k, use_mmr, use_rerank)
+
+    def _hyde_task_done(self, task: "asyncio.Future") -> None:
+        """Free the HyDE slot, and retrieve the error of a task abandoned at the deadline so asyncio does not report it."""
+        self._hyde_slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"HyDE retrieval failed: {task.exception()}")
+
+    async def _ahyde_search(self, query: str, top_k: int, filter: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        hyde_emb = self._project([await self.aembed_query(await self.ahyde_query(query))])[0]
+        return await asyncio.to_thread(self.vector_store.query, hyde_emb, top_k, filter)
+
+    def retrieve_many(self, queries: List[str], top_k: int = 5, use_hyde: bool = False, use_mmr: bool = False, use_rerank: bool = False,
+                      filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Batched `retrieve`: one embedding call and one vector store batch query for all queries."""
+        if not queries:
+            return []
+        fetch_k = 20 if (use_mmr or use_rerank) else top_k
+        keyword_futures = [self._submit_keyword(query, fetch_k, filter) for query in queries]
+
+        query_texts = self.hyde_queries(queries) if use_hyde else list(queries)
+        query_embs = self._project(self.embed_queries(query_texts))
+
+        batch_results = self.vector_store.query_batch(query_embs, top_k=fetch_k, filter=filter)
+        if self.keyword_index is not None:
+            batch_results = [
+                reciprocal_rank_fusion([results, future.result()], top_k=fetch_k)
+                for results, future in zip(batch_results, keyword_futures)
+            ]
+        return [
+            self._postprocess(query, query_emb, results, top_k, use_mmr, use_rerank)
+            for query, query_emb, results in zip(queries, query_embs, batch_results)
+        ]
+
+    def _submit_keyword(self, query: str, top_k: int, filter: Optional[Dict[str, Any]] = None):
+        if self.keyword_index is None:
+            return None
+        return self._executor.submit(self.keyword_index.query, query, top_k, filter)
+
+    def _project(self, embeddings: List[List[float]]) -> List[List[float]]:
+        """Map query embeddings into the store's (possibly reduced) embedding space."""
+        reducer = self.vector_store.reducer
+        if reducer is None:
+            return embeddings
+        return reducer.transform(embeddings).tolist()
+
+    def _candidate_embeddings(self, results: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Embeddings for MMR. Stores that return vectors with their matches
+        (Pinecone) carry them as "embedding"; only the rest, such as
+        keyword-only hits from hybrid fusion, are fetched by id.
+        """
+        carried = [r.get("embedding") for r in results]
+        missing = [i for i, vector in enumerate(carried) if vector is None]
+        if len(missing) == len(results):
+            return self.vector_store.get_embeddings([r["id"] for r in results])
+        out = np.zeros((len(results), len(next(v for v in carried if v is not None))), dtype=np.float32)
+        for i, vector in enumerate(carried):
+            if vector is not None:
+                out[i] = vector
+        if missing:
+            fetched = self.vector_store.get_embeddings([results[i]["id"] for i in missing])
+            if fetched.shape[1] == out.shape[1]:  # (n, 0) when none of the ids exist
+                out[missing] = fetched
+        return out
 
+    def _postprocess(self, query: str, query_emb: List[float], results: List[Dict[str, Any]], top_k: int,
+                     use_mmr: bool, use_rerank: bool) -> List[Dict[str, Any]]:
         # Maximal Margin Relevance(MMR) for diversity(aiding the LLM in generalization)
-        if use_mmr:
-            docs = [r["metadata"]["text"] for r in results]  # Extract texts for MMR
-            mmr_retriever = BM25Retriever.from_texts(docs)
-            mmr_retriever.search_type = "mmr"
-            results = mmr_retriever.get_relevant_documents(query)[:top_k]
+        if use_mmr and results:
+            results = [results[i] for i in mmr_select(query_emb, self._candidate_embeddings(results), top_k, self.mmr_lambda)]
+        if any("embedding" in r for r in results):
+            results = [{key: value for key, value in r.items() if key != "embedding"} for r in results]
 
         # Rerank for precision
         if use_rerank:
-            compressor = CohereRerank(top_n=top_k)
-            reranker = ContextualCompressionRetriever(base_compressor=compressor, base_retriever=results)
-            results = reranker.get_relevant_documents(query)
+            if self.rerank_fn is None:
+                self.rerank_fn = CrossEncoderReranker()
+            rerank = getattr(self.rerank_fn, "rerank", self.rerank_fn)
+            results = rerank(query, results, top_k)
 
-        return results
\ No newline at end of file
+        return results
@@ -0,0 +1,137 @@
+"""
+Multi-process sharded exact search over an InMemoryVectorStore's embedding matrix.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import os
+import numpy as np
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+from rag.retrieval.vector_store import VectorStore, InMemoryVectorStore, normalize, top_k_rows
+
+# Per-worker view of the matrix, set up once by _init_worker
+_worker_matrix: Optional[np.ndarray] = None
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_blas_limits = None  # held so the single-thread BLAS limit stays in force
+
+
+def _init_worker(source: Tuple):
+    """
+    Attach to the matrix without copying: re-open the snapshot memmap or the
+    shared memory block. BLAS is limited to one thread, since the shards
+    already occupy one process per core and threaded BLAS in every one of
+    them would oversubscribe the CPU.
+    """
+    global _worker_matrix, _worker_shm, _worker_blas_limits
+    if threadpool_limits is not None:
+        _worker_blas_limits = threadpool_limits(limits=1, user_api="blas")
+    else:
+        print("threadpoolctl not installed. Shard workers keep multi-threaded BLAS and may oversubscribe the CPU.")
+    kind = source[0]
+    if kind == "memmap":
+        _, filename, shape = source
+        _worker_matrix = np.load(filename, mmap_mode="r")[:shape[0]]
+    else:
+        _, name, shape = source
+        _worker_shm = shared_memory.SharedMemory(name=name)
+        _worker_matrix = np.ndarray(shape, dtype=np.float32, buffer=_worker_shm.buf)
+
+
+def _search_shard(queries: np.ndarray, start: int, stop: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Local top-k for rows [start, stop); returns global row indices and their scores."""
+    scores = queries @ _worker_matrix[start:stop].T
+    top = top_k_rows(scores, k)
+    return top + start, np.take_along_axis(scores, top, axis=1)
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Serves queries for a wrapped InMemoryVectorStore by splitting its matrix
+    into `n_shards` contiguous row ranges scored in parallel worker processes.
+    Each shard returns a local top-k and the parent merges them.
+
+    Workers never receive the matrix by pickling: a memory-mapped snapshot
+    (InMemoryVectorStore.load(mmap=True)) is re-opened by path in each
+    worker, and an in-RAM matrix is copied once into a shared memory block.
+    Corpora below `min_parallel_rows` and filtered queries are answered by the
+    wrapped store directly, since IPC would cost more than it saves. Writes go
+    to the wrapped store and the shards are re-published on the next query.
+    """
+    def __init__(self, store: InMemoryVectorStore, n_shards: Optional[int] = None, min_parallel_rows: int = 200000):
+        self.store = store
+        self.reducer = store.reducer
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.min_parallel_rows = min_parallel_rows
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._published_rows = 0
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _publish(self):
+        matrix = self.store.matrix
+        if isinstance(self.store._matrix, np.memmap) and self.store._matrix.filename:
+            source = ("memmap", self.store._matrix.filename, matrix.shape)
+        else:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+            np.ndarray(matrix.shape, dtype=np.float32, buffer=self._shm.buf)[:] = matrix
+            source = ("shm", self._shm.name, matrix.shape)
+        # Spawned, not forked: the pool starts lazily on the first query, usually from a request or executor thread
+        self._pool = ProcessPoolExecutor(max_workers=self.n_shards, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_worker, initargs=(source,))
+        self._published_rows = len(matrix)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def add_documents(self, docs: List[Dict[str, Any]]):
+        self.store.add_documents(docs)
+        self.close()  # shards are stale; re-published lazily
+
+    def delete(self, ids: List[str]) -> int:
+        removed = self.store.delete(ids)
+        self.close()
+        return removed
+
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]) -> bool:
+        return self.store.update_metadata(doc_id, metadata)
+
+    def get_embeddings(self, ids: List[str]) -> np.ndarray:
+        return self.store.get_embeddings(ids)
+
+    def query(self, query_embedding: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.query_batch([query_embedding], top_k=top_k, filter=filter)[0]
+
+    def query_batch(self, query_embeddings: List[List[float]], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        n = len(self.store)
+        if filter or n < self.min_parallel_rows or self.n_shards < 2 or len(query_embeddings) == 0:
+            return self.store.query_batch(query_embeddings, top_k=top_k, filter=filter)
+        if self._pool is None or self._published_rows != n:
+            self.close()
+            self._publish()
+
+        queries = normalize(query_embeddings)
+        bounds = np.linspace(0, n, self.n_shards + 1, dtype=np.int64)
+        futures = [
+            self._pool.submit(_search_shard, queries, int(start), int(stop), top_k)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+        parts = [future.result() for future in futures]
+        rows = np.concatenate([p[0] for p in parts], axis=1)
+        scores = np.concatenate([p[1] for p in parts], axis=1)
+        best = top_k_rows(scores, top_k)
+        return [
+            [self.store._result(int(rows[q, i]), scores[q, i]) for i in best[q]]
+            for q in range(len(queries))
+        ]
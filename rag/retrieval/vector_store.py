@@ -1,65 +1,549 @@
 """
 Vector store adapter interface and Pinecone/in-memory implementations with OpenAI embeddings.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from pinecone import Pinecone, ServerlessSpec
 from langchain_openai import OpenAIEmbeddings
+import collections.abc
 import os
+import json
+import uuid
 from dotenv import load_dotenv
 import numpy as np
+from rag.retrieval.batching import BatchEmbedder, retry_call
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
+# Minimum number of rows the in-memory matrix grows by when it runs out of capacity.
+GROWTH_CHUNK = 1024
+
+# Snapshot layout written by InMemoryVectorStore.save()
+SNAPSHOT_MATRIX_FILE = "embeddings.npy"
+SNAPSHOT_RECORDS_FILE = "records.json"
+SNAPSHOT_TEXTS_FILE = "texts.bin"  # UTF-8 texts back to back
+SNAPSHOT_TEXT_OFFSETS_FILE = "text_offsets.npy"  # int64, count + 1 byte offsets into texts.bin
+SNAPSHOT_FORMAT_VERSION = 2  # 1 kept the texts inside records.json
+SNAPSHOT_REDUCER_FILE = "reducer.npz"
+
+# Pinecone caps the number of ids per delete request.
+PINECONE_DELETE_BATCH = 1000
+
+
+def normalize(vectors) -> np.ndarray:
+    """Return `vectors` as a 2-D float32 array with unit-length rows."""
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / (norms + 1e-8)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores, best first, without sorting the whole array."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise `top_k_indices` for a (n_queries, n_docs) score matrix."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+
+class MappedTexts(collections.abc.Sequence):
+    """
+    Read-only snapshot texts: one UTF-8 blob plus row offsets, both
+    memory-mapped, so a load parses nothing and every worker process shares
+    one page-cached copy. A text is decoded only when its row is returned.
+    """
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    @classmethod
+    def open(cls, path: str) -> "MappedTexts":
+        blob_path = os.path.join(path, SNAPSHOT_TEXTS_FILE)
+        # np.memmap cannot map an empty file
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.empty(0, dtype=np.uint8)
+        return cls(blob, np.load(os.path.join(path, SNAPSHOT_TEXT_OFFSETS_FILE), mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("text index out of range")
+        return self._blob[self._offsets[row]:self._offsets[row + 1]].tobytes().decode("utf-8")
+
+
+def write_texts(path: str, texts: Sequence[str]):
+    """Write `texts` in the MappedTexts layout (blob, then offsets) under `path`."""
+    blob_path = os.path.join(path, SNAPSHOT_TEXTS_FILE)
+    offsets_path = os.path.join(path, SNAPSHOT_TEXT_OFFSETS_FILE)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(blob_path + ".tmp", "wb") as f:
+        for i, text in enumerate(texts):
+            encoded = text.encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    with open(offsets_path + ".tmp", "wb") as f:
+        np.save(f, offsets)
+    os.replace(blob_path + ".tmp", blob_path)
+    os.replace(offsets_path + ".tmp", offsets_path)
+
+
+class MetadataIndex:
+    """
+    Precomputed row lists per (metadata field, value) used to answer filters
+    without scanning every record. List-valued fields index each element.
+    Filters follow the Pinecone subset we use: {"field": value},
+    {"field": {"$eq": value}} or {"field": {"$in": [values]}}; several
+    fields are AND-ed.
+    """
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, set]] = {}
+        self._arrays: Dict[Tuple[str, Any], np.ndarray] = {}  # cached sorted row arrays
+
+    @staticmethod
+    def _values(value) -> List[Any]:
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        return [v for v in values if isinstance(v, (str, int, float, bool))]
+
+    def add(self, row: int, metadata: Dict[str, Any]):
+        for field, value in metadata.items():
+            for v in self._values(value):
+                self._postings.setdefault(field, {}).setdefault(v, set()).add(row)
+                self._arrays.pop((field, v), None)
+
+    def remove(self, row: int, metadata: Dict[str, Any]):
+        for field, value in metadata.items():
+            for v in self._values(value):
+                self._postings.get(field, {}).get(v, set()).discard(row)
+                self._arrays.pop((field, v), None)
+
+    def _value_rows(self, field: str, value) -> np.ndarray:
+        key = (field, value)
+        arr = self._arrays.get(key)
+        if arr is None:
+            arr = np.fromiter(sorted(self._postings.get(field, {}).get(value, ())), dtype=np.int64)
+            self._arrays[key] = arr
+        return arr
+
+    def rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Sorted row indices matching every condition in `filter`."""
+        result = None
+        for field, condition in filter.items():
+            if isinstance(condition, dict):
+                if set(condition) == {"$eq"}:
+                    values = [condition["$eq"]]
+                elif set(condition) == {"$in"}:
+                    values = list(condition["$in"])
+                else:
+                    raise ValueError(f"Unsupported filter operator for '{field}': {condition}")
+            else:
+                values = [condition]
+            if any(isinstance(v, (list, tuple, set, dict)) for v in values):
+                raise ValueError(f"Filter values for '{field}' must be scalars; use {{'$in': [...]}} to match any of several")
+            if not values:  # empty $in matches nothing
+                return np.empty(0, dtype=np.int64)
+            matched = [self._value_rows(field, v) for v in values]
+            field_rows = np.unique(np.concatenate(matched)) if len(matched) > 1 else matched[0]
+            result = field_rows if result is None else np.intersect1d(result, field_rows, assume_unique=True)
+        return result if result is not None else np.empty(0, dtype=np.int64)
+
+
+def default_embeddings() -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(model="text-embedding-3-large", api_key=OPENAI_API_KEY)
+
+
 class VectorStore:
+    # Optional rag.retrieval.reduction.Reducer applied to embeddings before they are stored.
+    # Query embeddings must be projected with the same reducer (Retriever does this).
+    reducer = None
+
     def add_documents(self, docs: List[Dict[str, Any]]):
         raise NotImplementedError
-    def query(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+    def query(self, query_embedding: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+    def query_batch(self, query_embeddings: List[List[float]], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """One result list per query embedding. Stores override this with a batched path."""
+        return [self.query(embedding, top_k=top_k, filter=filter) for embedding in query_embeddings]
+    def get_embeddings(self, ids: List[str]) -> np.ndarray:
+        """Stored embeddings for `ids` as a (len(ids), dim) matrix; unknown ids get zero rows."""
+        raise NotImplementedError
+    def delete(self, ids: List[str]):
+        """Remove documents by id; unknown ids are ignored."""
+        raise NotImplementedError
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]) -> bool:
+        """Merge `metadata` into a stored document's metadata without re-embedding; False if the id is unknown."""
         raise NotImplementedError
 
 class InMemoryVectorStore(VectorStore):
-    def __init__(self):
-        self.vectors = []  # List of dicts: {"id": str, "embedding": list, "metadata": dict, "text": str}
+    """
+    Exact cosine-similarity search over a contiguous float32 matrix.
+
+    Rows are normalized once on insert, so a query is a single matrix-vector
+    product followed by an argpartition top-k. The matrix grows geometrically
+    (at least GROWTH_CHUNK rows at a time) so appends are amortized O(1).
+    Documents are upserted by id, and a doc that already carries an
+    "embedding" is stored as-is instead of being re-embedded. Other docs are
+    embedded in concurrent batches (see BatchEmbedder).
+    """
+    def __init__(self, embeddings=None, batch_size: int = 64, max_workers: int = 4, reducer=None):
+        self.embeddings = embeddings
+        self.reducer = reducer
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._matrix: Optional[np.ndarray] = None  # (capacity, dim) float32, rows [:_size] are live
+        self._size = 0
+        self.ids: List[str] = []
+        self.texts: Sequence[str] = []  # MappedTexts after a memory-mapped load, a list once written to
+        self.metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._metadata_index: Optional[MetadataIndex] = None  # built on the first filtered query
+        self.snapshot_id: Optional[str] = None  # id of the snapshot last saved or loaded; ties sidecars to it
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Live (normalized) embedding rows."""
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
 
     def add_documents(self, docs: List[Dict[str, Any]]):
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large", api_key=OPENAI_API_KEY)
-        for doc in docs:
-            embedding = embeddings.embed_query(doc["text"])
-            self.vectors.append({
-                "id": doc["id"],
-                "embedding": embedding,
-                "metadata": doc["metadata"],
-                "text": doc["text"]
-            })
-
-    def query(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        def cosine(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-8)
-        scored = [(cosine(query_embedding, v["embedding"]), v) for v in self.vectors]
-        scored.sort(reverse=True, key=lambda x: x[0])
-        return [v for _, v in scored[:top_k]]
+        if any(doc.get("embedding") is None for doc in docs) and self.embeddings is None:
+            self.embeddings = default_embeddings()
+        embedder = BatchEmbedder(self.embeddings, batch_size=self.batch_size, max_workers=self.max_workers)
+        for batch, vectors in embedder.iter_embedded(docs):
+            if self.reducer is not None:
+                vectors = self.reducer.transform(vectors)
+            self._upsert(batch, normalize(vectors))
+
+    def _upsert(self, docs: Sequence[Dict[str, Any]], rows: np.ndarray) -> np.ndarray:
+        """Write normalized `rows` for `docs`, returning the matrix row each doc landed in."""
+        if self._matrix is None:
+            self._matrix = np.empty((max(GROWTH_CHUNK, len(docs)), rows.shape[1]), dtype=np.float32)
+        elif rows.shape[1] != self._matrix.shape[1]:
+            raise ValueError(f"Embedding dimension {rows.shape[1]} does not match index dimension {self._matrix.shape[1]}")
+
+        self._ensure_writable_texts()
+        targets = np.empty(len(docs), dtype=np.int64)
+        for i, doc in enumerate(docs):
+            row = self._id_to_row.get(doc["id"])
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._id_to_row[doc["id"]] = row
+                self.ids.append(doc["id"])
+                self.texts.append(doc["text"])
+                self.metadatas.append(doc.get("metadata", {}))
+            else:
+                if self._metadata_index is not None:
+                    self._metadata_index.remove(row, self.metadatas[row])
+                self.texts[row] = doc["text"]
+                self.metadatas[row] = doc.get("metadata", {})
+            if self._metadata_index is not None:
+                self._metadata_index.add(row, self.metadatas[row])
+            targets[i] = row
+
+        self._ensure_capacity(self._size)
+        self._matrix[targets] = rows
+        return targets
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Remove `ids` (unknown ids are ignored) and return how many were removed.
+        Each freed row is filled by moving the current last row into it, so
+        the live rows stay contiguous and no rescan or rebuild is needed.
+        """
+        rows = sorted({self._id_to_row[doc_id] for doc_id in ids if doc_id in self._id_to_row}, reverse=True)
+        if not rows:
+            return 0
+        self._ensure_capacity(self._size)
+        self._ensure_writable_texts()
+        # Descending order: rows after `row` still pending deletion are already gone, so `last` is always live.
+        for row in rows:
+            last = self._size - 1
+            self._remove_row(row, last)
+            if self._metadata_index is not None:
+                self._metadata_index.remove(row, self.metadatas[row])
+            del self._id_to_row[self.ids[row]]
+            if row != last:
+                if self._metadata_index is not None:
+                    self._metadata_index.remove(last, self.metadatas[last])
+                    self._metadata_index.add(row, self.metadatas[last])
+                self._matrix[row] = self._matrix[last]
+                self.ids[row], self.texts[row], self.metadatas[row] = self.ids[last], self.texts[last], self.metadatas[last]
+                self._id_to_row[self.ids[row]] = row
+            self.ids.pop()
+            self.texts.pop()
+            self.metadatas.pop()
+            self._size -= 1
+        return len(rows)
+
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]) -> bool:
+        row = self._id_to_row.get(doc_id)
+        if row is None:
+            return False
+        if self._metadata_index is not None:
+            self._metadata_index.remove(row, self.metadatas[row])
+        self.metadatas[row] = {**self.metadatas[row], **metadata}
+        if self._metadata_index is not None:
+            self._metadata_index.add(row, self.metadatas[row])
+        return True
+
+    def _remove_row(self, row: int, last: int):
+        """Hook for subclasses with per-row structures: `row` is being deleted and `last` will move into it."""
+
+    def _ensure_writable_texts(self):
+        if not isinstance(self.texts, list):
+            # Memory-mapped snapshot texts: decode into a list on first write, like the matrix.
+            self.texts = list(self.texts)
+
+    def _ensure_capacity(self, needed: int):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            if not self._matrix.flags.writeable:
+                # Memory-mapped snapshot: copy on first write instead of touching the shared file.
+                self._matrix = np.array(self._matrix)
+            return
+        new_capacity = max(needed, capacity + max(GROWTH_CHUNK, capacity // 2))
+        grown = np.empty((new_capacity, self._matrix.shape[1]), dtype=np.float32)
+        grown[:capacity] = self._matrix
+        self._matrix = grown
+
+    def save(self, path: str):
+        """
+        Write a snapshot to directory `path`: the live embedding rows as a raw
+        .npy matrix, the texts as a UTF-8 blob with an offsets array (see
+        MappedTexts) and a JSON sidecar with ids and metadata. Files are
+        written under temporary names and renamed into place, sidecar last.
+        """
+        os.makedirs(path, exist_ok=True)
+        matrix_path = os.path.join(path, SNAPSHOT_MATRIX_FILE)
+        records_path = os.path.join(path, SNAPSHOT_RECORDS_FILE)
+
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.matrix))
+        os.replace(matrix_path + ".tmp", matrix_path)
+        write_texts(path, self.texts)
+
+        # Subclass sidecars (_save_extra) record this id; a sidecar left behind by an older snapshot will not match
+        self.snapshot_id = uuid.uuid4().hex
+        records = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "snapshot_id": self.snapshot_id,
+            "count": self._size,
+            "ids": self.ids,
+            "metadatas": self.metadatas
+        }
+        with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(records_path + ".tmp", records_path)
+        if self.reducer is not None:
+            self.reducer.save(os.path.join(path, SNAPSHOT_REDUCER_FILE))
+        self._save_extra(path)
+
+    def _save_extra(self, path: str):
+        """Hook for subclasses that persist auxiliary index structures next to the snapshot."""
+
+    def _load_extra(self, path: str, mmap: bool):
+        """Counterpart of `_save_extra`, called after the base snapshot is loaded."""
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, **kwargs) -> "InMemoryVectorStore":
+        """
+        Load a snapshot written by `save`. With `mmap=True` the embedding matrix
+        is opened read-only via numpy.memmap, so processes loading the same
+        snapshot share one page-cached copy; the first write copies it into RAM.
+        The texts are mapped the same way; ids and metadata are parsed from JSON.
+        """
+        with open(os.path.join(path, SNAPSHOT_RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if records.get("format_version") not in (1, SNAPSHOT_FORMAT_VERSION):
+            raise ValueError(f"Unsupported snapshot format: {records.get('format_version')}")
+
+        matrix = np.load(os.path.join(path, SNAPSHOT_MATRIX_FILE), mmap_mode="r" if mmap else None)
+        if matrix.shape[0] != records["count"]:
+            raise ValueError(f"Snapshot at {path} is inconsistent: {matrix.shape[0]} rows, {records['count']} records")
+
+        store = cls(**kwargs)
+        reducer_path = os.path.join(path, SNAPSHOT_REDUCER_FILE)
+        if store.reducer is None and os.path.exists(reducer_path):
+            from rag.retrieval.reduction import load_reducer  # reduction imports this module
+            store.reducer = load_reducer(reducer_path)
+        store._matrix = matrix if matrix.shape[0] else None
+        store._size = records["count"]
+        store.ids = records["ids"]
+        if "texts" in records:  # format 1
+            store.texts = records["texts"]
+        else:
+            texts = MappedTexts.open(path)
+            if len(texts) != records["count"]:
+                raise ValueError(f"Snapshot at {path} is inconsistent: {len(texts)} texts, {records['count']} records")
+            store.texts = texts if mmap else list(texts)
+        store.metadatas = records["metadatas"]
+        store._id_to_row = {doc_id: row for row, doc_id in enumerate(store.ids)}
+        store.snapshot_id = records.get("snapshot_id")
+        store._load_extra(path, mmap)
+        return store
+
+    def get_embeddings(self, ids: List[str]) -> np.ndarray:
+        dim = self.dim or 0
+        out = np.zeros((len(ids), dim), dtype=np.float32)
+        rows = [(i, self._id_to_row[doc_id]) for i, doc_id in enumerate(ids) if doc_id in self._id_to_row]
+        if rows:
+            positions, matrix_rows = zip(*rows)
+            out[list(positions)] = self.matrix[list(matrix_rows)]
+        return out
+
+    def _result(self, row: int, score: float) -> Dict[str, Any]:
+        return {
+            "id": self.ids[row],
+            "score": float(score),
+            "text": self.texts[row],
+            "metadata": self.metadatas[row]
+        }
+
+    def _filter_rows(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Rows matching `filter`, or None when every row is eligible."""
+        if not filter:
+            return None
+        index = self._metadata_index
+        if index is None:
+            # Built fully before it is published, so concurrent queries never see a partial index
+            index = MetadataIndex()
+            for row, metadata in enumerate(self.metadatas):
+                index.add(row, metadata)
+            self._metadata_index = index
+        return index.rows(filter)
+
+    def query(self, query_embedding: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.query_batch([query_embedding], top_k=top_k, filter=filter)[0]
+
+    def query_batch(self, query_embeddings: List[List[float]], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        if len(query_embeddings) == 0:
+            return []
+        if self._size == 0:
+            return [[] for _ in query_embeddings]
+        queries = normalize(query_embeddings)
+        rows = self._filter_rows(filter)
+        if rows is None:
+            scores = queries @ self.matrix.T
+        elif len(rows) == 0:
+            return [[] for _ in query_embeddings]
+        else:
+            # Only the rows that pass the filter are scored
+            scores = queries @ self.matrix[rows].T
+
+        results = []
+        for top, row_scores in zip(top_k_rows(scores, top_k), scores):
+            hits = top if rows is None else rows[top]
+            results.append([self._result(row, score) for row, score in zip(hits, row_scores[top])])
+        return results
 
 class PineconeVectorStore(VectorStore):
-    def __init__(self, index_name: str):
+    def __init__(self, index_name: str, embeddings=None, batch_size: int = 64, max_workers: int = 4,
+                 upsert_batch_size: int = 100, max_concurrent_queries: int = 8, reducer=None, include_values: bool = True):
         pc = Pinecone(api_key=PINECONE_API_KEY)
         self.index = pc.Index(index_name)
+        self.embeddings = embeddings
+        self.reducer = reducer
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.upsert_batch_size = upsert_batch_size  # Keeps each request under Pinecone's payload limit
+        self.max_concurrent_queries = max_concurrent_queries
+        # Return each match's vector as "embedding", so MMR needs no extra index.fetch round trip
+        self.include_values = include_values
 
     def add_documents(self, docs: List[Dict[str, Any]]):
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large", api_key=OPENAI_API_KEY)
-        vectors = [
-            {
-                "id": doc["id"],
-                "values": embeddings.embed_query(doc["text"]),
-                "metadata": {"text": doc["text"], **doc["metadata"]}
-            }
-            for doc in docs
-        ]
-        self.index.upsert(vectors=vectors)
+        if any(doc.get("embedding") is None for doc in docs) and self.embeddings is None:
+            self.embeddings = default_embeddings()
+        embedder = BatchEmbedder(self.embeddings, batch_size=self.batch_size, max_workers=self.max_workers)
+        pending = []
+        for batch, vectors in embedder.iter_embedded(docs):
+            if self.reducer is not None:
+                vectors = self.reducer.transform(vectors)
+            pending.extend(
+                {
+                    "id": doc["id"],
+                    "values": np.asarray(vector, dtype=float).tolist(),
+                    "metadata": {"text": doc["text"], **doc["metadata"]}
+                }
+                for doc, vector in zip(batch, vectors)
+            )
+            while len(pending) >= self.upsert_batch_size:
+                self._upsert(pending[:self.upsert_batch_size])
+                pending = pending[self.upsert_batch_size:]
+        if pending:
+            self._upsert(pending)
 
-    def query(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        results = self.index.query(vector=query_embedding, top_k=top_k, include_metadata=True)
+    def _upsert(self, vectors: List[Dict[str, Any]]):
+        retry_call(lambda: self.index.upsert(vectors=vectors))
+
+    def query(self, query_embedding: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        # Metadata filters use Pinecone's native filter syntax, so they pass straight through
+        kwargs = {"filter": filter} if filter else {}
+        results = self.index.query(vector=query_embedding, top_k=top_k, include_metadata=True,
+                                   include_values=self.include_values, **kwargs)
         return [
-            {"id": match["id"], "score": match["score"], "metadata": match["metadata"]}
+            {"id": match["id"], "score": match["score"], "text": match["metadata"].get("text", ""), "metadata": match["metadata"],
+             **({"embedding": match["values"]} if self.include_values and match.get("values") else {})}
             for match in results["matches"]
-        ]
\ No newline at end of file
+        ]
+
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]) -> bool:
+        retry_call(lambda: self.index.update(id=doc_id, set_metadata=metadata))
+        return True
+
+    def delete(self, ids: List[str]):
+        ids = list(ids)
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH):
+            chunk = ids[start:start + PINECONE_DELETE_BATCH]
+            retry_call(lambda: self.index.delete(ids=chunk))
+
+    def get_embeddings(self, ids: List[str]) -> np.ndarray:
+        if not ids:
+            return np.empty((0, 0), dtype=np.float32)
+        vectors = self.index.fetch(ids=list(ids)).vectors
+        dim = next((len(v.values) for v in vectors.values()), 0)
+        out = np.zeros((len(ids), dim), dtype=np.float32)
+        for i, doc_id in enumerate(ids):
+            if doc_id in vectors:
+                out[i] = vectors[doc_id].values
+        return out
+
+    def query_batch(self, query_embeddings: List[List[float]], top_k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        # Pinecone has no multi-vector query endpoint; issue the requests concurrently instead.
+        if len(query_embeddings) <= 1:
+            return [self.query(embedding, top_k=top_k, filter=filter) for embedding in query_embeddings]
+        workers = min(self.max_concurrent_queries, len(query_embeddings))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda embedding: self.query(embedding, top_k=top_k, filter=filter), query_embeddings))
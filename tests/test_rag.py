@@ -3,9 +3,86 @@ Basic tests for RAG ingestion pipeline.
 """
 import unittest
 from rag.ingestion.loader import DocumentLoader
-from rag.ingestion.chunker import DocumentChunker
+from rag.ingestion.chunker import DocumentChunker, count_tokens
+from rag.ingestion.manifest import IngestionManifest
+from rag.ingestion.incremental import IncrementalIndexer
+from rag.ingestion.pipeline import IngestionPipeline
+from rag.ingestion.dedup import NearDuplicateFilter
 from rag.retrieval.vector_store import InMemoryVectorStore
 from rag.retrieval.retriever import Retriever
+from rag.retrieval.embedding_cache import CachedEmbeddings
+from rag.retrieval.batching import BatchEmbedder
+from rag.retrieval.query_cache import QueryCache
+from rag.retrieval.ivf_store import IVFVectorStore
+from rag.retrieval.quantized_store import QuantizedVectorStore
+from rag.retrieval.sharded_store import ShardedVectorStore
+from rag.retrieval.reduction import PCAReducer, project_store
+from rag.retrieval.bm25_index import BM25Index, tokenize
+from rag.retrieval.fusion import reciprocal_rank_fusion
+from rag.retrieval.mmr import mmr_select
+from rag.retrieval.reranker import CrossEncoderReranker
+from rag.augmentation.augmenter import RAGAugmenter
+from rag.augmentation.compressor import ExtractiveCompressor
+from rag.agents.semantic_cache import SemanticAnswerCache
+import asyncio
+import gc
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+
+def import_flask_app():
+    """
+    The Flask app in api/app, imported against a throwaway local index and
+    placeholder API keys; os.environ and sys.path are restored afterwards.
+    """
+    if "app.routes" not in sys.modules:
+        index_path = tempfile.mkdtemp()
+        store = InMemoryVectorStore()
+        store.add_documents([{"id": "a", "text": "Returns within 30 days.", "embedding": [1.0, 0.0], "metadata": {}}])
+        store.save(index_path)
+        env = {"RAG_INDEX_PATH": index_path, "RAG_KEYWORD_INDEX_PATH": os.path.join(index_path, "bm25"),
+               "RAG_MANIFEST_PATH": os.path.join(index_path, "manifest.json"),
+               "OPENAI_API_KEY": "test", "DEEPSEEK_API_KEY": "test"}
+        api_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+        with mock.patch.dict(os.environ, env), mock.patch.object(sys, "path", [api_dir] + sys.path):
+            importlib.import_module("app")
+    return sys.modules["app"]
+
+
+def placeholder_api_key():
+    """The generators build their OpenAI client on construction, which needs a key even when the client is replaced."""
+    return mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test"})
+
+
+class FakeChatClient:
+    """Stands in for (Async)OpenAI: each `chat.completions.create` call returns or raises the next scripted response."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def stream_chunk(content=None, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def tool_call_delta(index, call_id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
 
 class TestDocumentLoader(unittest.TestCase):
     def test_load_json(self):
@@ -20,6 +97,31 @@ class TestDocumentLoader(unittest.TestCase):
         loader = DocumentLoader(source_dir="data/documents")
         self.assertIsInstance(loader.load_csv(), list)
 
+    def test_iter_documents_streams_with_source(self):
+        source_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(source_dir, "catalog"))
+        with open(os.path.join(source_dir, "faq.json"), "w", encoding="utf-8") as f:
+            json.dump([{"text": "Returns within 30 days.", "metadata": {"category": "returns"}}], f)
+        with open(os.path.join(source_dir, "catalog", "products.csv"), "w", encoding="utf-8") as f:
+            f.write("sku,name\nPROD-001,Backpack\nPROD-002,Laptop\n")
+        docs = DocumentLoader(source_dir=source_dir).iter_documents()
+        self.assertNotIsInstance(docs, list)
+        docs = list(docs)
+        self.assertEqual([d["source"] for d in docs], ["faq.json"] + [os.path.join("catalog", "products.csv")] * 2)
+        self.assertEqual(docs[0]["metadata"], {"category": "returns"})
+        self.assertEqual(docs[1]["metadata"], {"sku": "PROD-001", "name": "Backpack"})
+
+    def test_iter_files_yields_every_requested_file_once(self):
+        source_dir = tempfile.mkdtemp()
+        with open(os.path.join(source_dir, "faq.json"), "w", encoding="utf-8") as f:
+            json.dump([{"text": "Returns within 30 days."}], f)
+        with open(os.path.join(source_dir, "broken.json"), "w", encoding="utf-8") as f:
+            f.write("{not json")
+        loader = DocumentLoader(source_dir=source_dir)
+        files = dict(loader.iter_files([os.path.join(source_dir, "broken.json"), os.path.join(source_dir, "faq.json")]))
+        self.assertEqual(files["broken.json"], [])
+        self.assertEqual([d["text"] for d in files["faq.json"]], ["Returns within 30 days."])
+
 class TestDocumentChunker(unittest.TestCase):
     def test_chunk_text(self):
         chunker = DocumentChunker()
@@ -32,6 +134,530 @@ class TestDocumentChunker(unittest.TestCase):
         chunked = chunker.chunk_docs(docs)
         self.assertIsInstance(chunked, list)
 
+    def test_token_mode_parallel_chunks_match_serial(self):
+        docs = [{"text": f"Item {i}. " + "Warranty covers defects for two years. " * (20 + i), "source": f"doc{i}"} for i in range(6)]
+        serial = DocumentChunker(chunk_size=40, chunk_overlap=5, length_unit="tokens")
+        parallel = DocumentChunker(chunk_size=40, chunk_overlap=5, length_unit="tokens", max_workers=2, docs_per_task=2)
+        self.addCleanup(parallel.close)
+        chunks = serial.chunk_docs(docs)
+        self.assertEqual(parallel.chunk_docs(docs), chunks)
+        self.assertTrue(all(count_tokens(c["text"]) <= 40 for c in chunks))
+        self.assertEqual([c["source"] for c in chunks], sorted(c["source"] for c in chunks))
+
+class TestInMemoryVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.store = InMemoryVectorStore()
+        self.store.add_documents([
+            {"id": "a", "text": "Backpack", "embedding": [1.0, 0.0, 0.0], "metadata": {"source": "a.json"}},
+            {"id": "b", "text": "Laptop", "embedding": [0.0, 1.0, 0.0], "metadata": {"source": "b.json"}},
+            {"id": "c", "text": "Refunds", "embedding": [0.7, 0.7, 0.0], "metadata": {"source": "c.json"}}
+        ])
+
+    def test_query_returns_scored_top_k(self):
+        results = self.store.query([1.0, 0.1, 0.0], top_k=2)
+        self.assertEqual([r["id"] for r in results], ["a", "c"])
+        self.assertGreater(results[0]["score"], results[1]["score"])
+        self.assertEqual(results[0]["text"], "Backpack")
+
+    def test_upsert_replaces_existing_id(self):
+        self.store.add_documents([{"id": "a", "text": "Tent", "embedding": [0.0, 0.0, 1.0], "metadata": {}}])
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.query([0.0, 0.0, 1.0], top_k=1)[0]["text"], "Tent")
+
+    def test_query_batch_matches_single_queries(self):
+        queries = [[1.0, 0.1, 0.0], [0.0, 1.0, 0.2]]
+        batched = self.store.query_batch(queries, top_k=2)
+        self.assertEqual(len(batched), 2)
+        for query, results in zip(queries, batched):
+            self.assertEqual([r["id"] for r in results], [r["id"] for r in self.store.query(query, top_k=2)])
+
+    def test_metadata_filter_scores_only_matching_rows(self):
+        results = self.store.query([1.0, 0.1, 0.0], top_k=3, filter={"source": {"$in": ["b.json", "c.json"]}})
+        self.assertEqual([r["id"] for r in results], ["c", "b"])
+        self.assertEqual(self.store.query([1.0, 0.0, 0.0], top_k=3, filter={"source": "missing.json"}), [])
+
+    def test_metadata_filter_edge_cases(self):
+        self.assertEqual(self.store.query([1.0, 0.0, 0.0], top_k=3, filter={"source": {"$in": []}}), [])
+        with self.assertRaises(ValueError):
+            self.store.query([1.0, 0.0, 0.0], top_k=3, filter={"source": ["a.json", "b.json"]})
+
+    def test_save_and_load_memory_mapped(self):
+        path = tempfile.mkdtemp()
+        self.store.save(path)
+        loaded = InMemoryVectorStore.load(path, mmap=True)
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.query([1.0, 0.1, 0.0], top_k=1)[0]["metadata"], {"source": "a.json"})
+        self.assertEqual(list(loaded.texts), ["Backpack", "Laptop", "Refunds"])
+        loaded.add_documents([{"id": "d", "text": "Tent", "embedding": [0.0, 0.0, 1.0], "metadata": {}}])
+        self.assertEqual(loaded.texts[-1], "Tent")
+        self.assertEqual(len(InMemoryVectorStore.load(path)), 3)
+
+    def test_loads_format_1_snapshot(self):
+        path = tempfile.mkdtemp()
+        self.store.save(path)
+        with open(os.path.join(path, "records.json"), encoding="utf-8") as f:
+            records = json.load(f)
+        records.update(format_version=1, texts=list(self.store.texts))
+        with open(os.path.join(path, "records.json"), "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        os.remove(os.path.join(path, "texts.bin"))
+        self.assertEqual(InMemoryVectorStore.load(path).query([0.0, 1.0, 0.0], top_k=1)[0]["text"], "Laptop")
+
+    def test_delete_moves_last_row_into_gap(self):
+        self.assertEqual(self.store.delete(["a", "missing"]), 1)
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.ids, ["c", "b"])
+        self.assertEqual(self.store.query([1.0, 0.0, 0.0], top_k=1)[0]["id"], "c")
+        self.assertEqual(self.store.query([1.0, 0.0, 0.0], top_k=3, filter={"source": "c.json"})[0]["id"], "c")
+
+class TestIVFVectorStore(unittest.TestCase):
+    def test_trains_and_persists(self):
+        store = IVFVectorStore(nlist=2, nprobe=2, min_train_size=4)
+        store.add_documents([
+            {"id": str(i), "text": f"doc {i}", "embedding": [1.0, i * 0.1] if i < 3 else [i * 0.1, 1.0], "metadata": {}}
+            for i in range(6)
+        ])
+        self.assertTrue(store.is_trained)
+        self.assertEqual(store.query([1.0, 0.0], top_k=1)[0]["id"], "0")
+
+        path = tempfile.mkdtemp()
+        store.save(path)
+        loaded = IVFVectorStore.load(path, nprobe=2)
+        self.assertTrue(loaded.is_trained)
+        self.assertEqual(loaded.query([0.5, 1.0], top_k=1)[0]["id"], "5")
+
+    def test_stale_sidecar_is_reassigned(self):
+        docs = [
+            {"id": str(i), "text": f"doc {i}", "embedding": [1.0, i * 0.05, (i % 4) * 0.3], "metadata": {}}
+            for i in range(40)
+        ]
+        store = IVFVectorStore(nlist=4, nprobe=4, min_train_size=10)
+        store.add_documents(docs)
+        path = tempfile.mkdtemp()
+        store.save(path)
+        # Rewritten through the plain store: ivf.npz stays behind with 40 assignments
+        plain = InMemoryVectorStore.load(path, mmap=False)
+        plain.delete([str(i) for i in range(10)])
+        plain.add_documents([{**doc, "id": f"new{doc['id']}"} for doc in docs[:5]])
+        plain.save(path)
+
+        loaded = IVFVectorStore.load(path, nprobe=4)
+        self.assertTrue(loaded.is_trained)
+        query = [1.0, 0.4, 0.6]
+        self.assertEqual([r["id"] for r in loaded.query(query, top_k=5)], [r["id"] for r in plain.query(query, top_k=5)])
+
+class TestQuantizedVectorStore(unittest.TestCase):
+    def test_rescored_results_match_exact_search(self):
+        docs = [
+            {"id": str(i), "text": f"doc {i}", "embedding": [1.0, i * 0.05, (i % 3) * 0.2], "metadata": {}}
+            for i in range(20)
+        ]
+        exact, quantized = InMemoryVectorStore(), QuantizedVectorStore(min_rescore=5)
+        exact.add_documents(docs)
+        quantized.add_documents(docs)
+        query = [1.0, 0.3, 0.2]
+        self.assertEqual([r["id"] for r in quantized.query(query, top_k=3)], [r["id"] for r in exact.query(query, top_k=3)])
+
+        path = tempfile.mkdtemp()
+        exact.save(path)
+        loaded = QuantizedVectorStore.load(path, mmap=True)
+        self.assertEqual(loaded.codes.dtype.name, "int8")
+        self.assertEqual(loaded.query(query, top_k=1)[0]["id"], exact.query(query, top_k=1)[0]["id"])
+
+    def test_stale_codes_are_requantized(self):
+        docs = [
+            {"id": str(i), "text": f"doc {i}", "embedding": [1.0, i * 0.05, (i % 3) * 0.2], "metadata": {}}
+            for i in range(20)
+        ]
+        quantized = QuantizedVectorStore(min_rescore=5)
+        quantized.add_documents(docs)
+        path = tempfile.mkdtemp()
+        quantized.save(path)
+        # Rewritten through the plain store: the int8 codes stay behind and no longer line up with the rows
+        plain = InMemoryVectorStore.load(path, mmap=False)
+        plain.delete([str(i) for i in range(5)])
+        plain.add_documents([{**doc, "id": f"new{doc['id']}", "embedding": doc["embedding"][::-1]} for doc in docs[:3]])
+        plain.save(path)
+
+        loaded = QuantizedVectorStore.load(path, min_rescore=5)
+        self.assertEqual(loaded.codes.shape, loaded.matrix.shape)
+        query = [0.2, 0.3, 1.0]
+        self.assertEqual([r["id"] for r in loaded.query(query, top_k=3)], [r["id"] for r in plain.query(query, top_k=3)])
+
+class TestShardedVectorStore(unittest.TestCase):
+    def test_sharded_results_match_exact_search(self):
+        docs = [
+            {"id": str(i), "text": f"doc {i}", "embedding": [1.0, i * 0.05, (i % 4) * 0.3], "metadata": {"shard": i % 2}}
+            for i in range(30)
+        ]
+        exact = InMemoryVectorStore()
+        exact.add_documents(docs)
+        sharded = ShardedVectorStore(exact, n_shards=3, min_parallel_rows=0)
+        self.addCleanup(sharded.close)
+        queries = [[1.0, 0.3, 0.2], [0.2, 1.0, 0.0]]
+        for query, results in zip(queries, sharded.query_batch(queries, top_k=4)):
+            self.assertEqual([r["id"] for r in results], [r["id"] for r in exact.query(query, top_k=4)])
+        filtered = sharded.query(queries[0], top_k=2, filter={"shard": 1})
+        self.assertTrue(all(r["metadata"]["shard"] == 1 for r in filtered))
+
+class TestReduction(unittest.TestCase):
+    def test_pca_store_round_trip(self):
+        store = InMemoryVectorStore()
+        store.add_documents([
+            {"id": str(i), "text": f"doc {i}", "embedding": [1.0, i * 0.1, i * 0.2, 0.01 * (i % 2)], "metadata": {}}
+            for i in range(10)
+        ])
+        reducer = PCAReducer(2).fit(store.matrix)
+        reduced = project_store(store, reducer)
+        self.assertEqual(reduced.dim, 2)
+
+        path = tempfile.mkdtemp()
+        reduced.save(path)
+        loaded = InMemoryVectorStore.load(path)
+        self.assertIsInstance(loaded.reducer, PCAReducer)
+        query = loaded.reducer.transform([store.matrix[3]])[0]
+        self.assertEqual(loaded.query(query, top_k=1)[0]["id"], "3")
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add_documents([
+            {"id": "a", "text": "Samsung Galaxy S21 smartphone PROD-001", "metadata": {}},
+            {"id": "b", "text": "Items may be returned within 30 days", "metadata": {}},
+            {"id": "c", "text": "Galaxy watch accessories", "metadata": {}}
+        ])
+
+    def test_tokenize_keeps_sku_codes(self):
+        self.assertIn("prod-001", tokenize("Order PROD-001 now"))
+        self.assertIn("001", tokenize("Order PROD-001 now"))
+
+    def test_query_ranks_exact_product_match_first(self):
+        results = self.index.query("galaxy s21", top_k=3)
+        self.assertEqual([r["id"] for r in results], ["a", "c"])
+
+    def test_save_and_load(self):
+        path = tempfile.mkdtemp()
+        self.index.save(path)
+        self.assertEqual(BM25Index.load(path).query("returned", top_k=1)[0]["id"], "b")
+
+    def test_concurrent_queries_merge_pending_postings_once(self):
+        barrier, results = threading.Barrier(8), []
+        def query():
+            barrier.wait()
+            results.append([r["id"] for r in self.index.query("galaxy s21", top_k=3)])
+        with mock.patch.object(self.index, "_finalize", wraps=self.index._finalize) as finalize:
+            threads = [threading.Thread(target=query) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(finalize.call_count, 1)
+        self.assertEqual(results, [["a", "c"]] * 8)
+
+    def test_reciprocal_rank_fusion(self):
+        dense = [{"id": "a", "score": 0.9}, {"id": "b", "score": 0.5}]
+        keyword = [{"id": "b", "keyword_score": 3.0}, {"id": "c", "keyword_score": 1.0}]
+        fused = reciprocal_rank_fusion([dense, keyword])
+        self.assertEqual([d["id"] for d in fused], ["b", "a", "c"])
+        self.assertEqual(fused[0]["score"], 0.5)
+
+class TestMMR(unittest.TestCase):
+    def test_mmr_skips_near_duplicates(self):
+        candidates = [[1.0, 0.0, 0.0], [0.99, 0.01, 0.0], [0.6, 0.0, 0.8]]
+        self.assertEqual(mmr_select([1.0, -0.05, 0.1], candidates, k=2, lambda_mult=0.5), [0, 2])
+        self.assertEqual(mmr_select([1.0, -0.05, 0.1], candidates, k=2, lambda_mult=1.0), [0, 1])
+
+    def test_retriever_fetches_only_vectors_not_carried_on_results(self):
+        class ValuesStore(InMemoryVectorStore):
+            """Returns vectors with matches, like PineconeVectorStore(include_values=True)."""
+            fetched = []
+
+            def query(self, query_embedding, top_k=5, filter=None):
+                return [{**r, "embedding": InMemoryVectorStore.get_embeddings(self, [r["id"]])[0].tolist()}
+                        for r in super().query(query_embedding, top_k=top_k, filter=filter)]
+
+            def get_embeddings(self, ids):
+                self.fetched.append(list(ids))
+                return super().get_embeddings(ids)
+
+        store, keyword_index = ValuesStore(), BM25Index()
+        store.add_documents([
+            {"id": "a", "text": "Backpack", "embedding": [1.0, 0.0, 0.0], "metadata": {}},
+            {"id": "b", "text": "Backpack strap", "embedding": [0.99, 0.01, 0.0], "metadata": {}}
+        ])
+        keyword_index.add_documents([{"id": "kw", "text": "backpack warranty", "metadata": {}}])
+        embedder = type("Embedder", (), {"embed_query": lambda self, text: [1.0, 0.0, 0.0]})()
+        retriever = Retriever(store, embedder, hyde_llm=object(), keyword_index=keyword_index)
+        store.fetched.clear()
+        results = retriever.retrieve("backpack", top_k=3, use_mmr=True)
+        self.assertEqual(store.fetched, [["kw"]])
+        self.assertEqual({r["id"] for r in results}, {"a", "b", "kw"})
+        self.assertTrue(all("embedding" not in r for r in results))
+
+class TestCrossEncoderReranker(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        def scorer(pairs):
+            self.calls.append(len(pairs))
+            return [len(text) for _, text in pairs]
+        self.reranker = CrossEncoderReranker(scorer=scorer, decisive_margin=0.3)
+        self.docs = [
+            {"id": "a", "text": "x", "score": 0.5},
+            {"id": "b", "text": "xxx", "score": 0.4},
+            {"id": "c", "text": "xx", "score": 0.3}
+        ]
+
+    def test_rerank_orders_by_score_and_caches_pairs(self):
+        self.assertEqual([d["id"] for d in self.reranker.rerank("q", self.docs, 2)], ["b", "c"])
+        self.reranker.rerank("q", self.docs, 2)
+        self.assertEqual(self.calls, [3])
+
+    def test_decisive_margin_skips_scoring(self):
+        docs = [{"id": "a", "text": "x", "score": 0.9}, {"id": "b", "text": "xxx", "score": 0.4}]
+        self.assertEqual([d["id"] for d in self.reranker.rerank("q", docs, 1)], ["a"])
+        self.assertEqual(self.calls, [])
+
+class TestBatchEmbedder(unittest.TestCase):
+    class FlakyEmbeddings:
+        """Fails the first request for the batch containing `fail_text`."""
+        def __init__(self, fail_text):
+            self.fail_text = fail_text
+            self.failed = False
+            self.embedded = []  # texts of every successful request
+            self.lock = threading.Lock()
+
+        def embed_documents(self, texts):
+            with self.lock:
+                if self.fail_text in texts and not self.failed:
+                    self.failed = True
+                    raise ConnectionError("rate limited")
+                self.embedded.append(tuple(texts))
+            return [[float(text.split()[-1]), 1.0] for text in texts]
+
+    def test_failed_batch_is_retried_alone(self):
+        docs = [{"id": str(i), "text": f"doc {i}", "metadata": {}} for i in range(8)]
+        embeddings = self.FlakyEmbeddings("doc 3")
+        embedder = BatchEmbedder(embeddings, batch_size=2, max_workers=4, retry_backoff=0.0)
+        results = list(embedder.iter_embedded(docs))
+
+        self.assertTrue(embeddings.failed)
+        self.assertEqual(sorted(embeddings.embedded), [("doc 0", "doc 1"), ("doc 2", "doc 3"), ("doc 4", "doc 5"), ("doc 6", "doc 7")])
+        embedded = {doc["id"]: vector for batch, vectors in results for doc, vector in zip(batch, vectors)}
+        self.assertEqual(embedded, {str(i): [float(i), 1.0] for i in range(8)})
+
+class TestCachedEmbeddings(unittest.TestCase):
+    class CountingEmbeddings:
+        model = "test-model"
+        def __init__(self):
+            self.calls = 0
+        def embed_documents(self, texts):
+            self.calls += len(texts)
+            return [[float(len(t)), 1.0] for t in texts]
+
+    def test_cache_hits_across_instances(self):
+        path = os.path.join(tempfile.mkdtemp(), "embeddings.sqlite")
+        inner = self.CountingEmbeddings()
+        CachedEmbeddings(inner, cache_path=path).embed_documents(["a", "bb"])
+        cache = CachedEmbeddings(inner, cache_path=path)
+        self.assertEqual(cache.embed_documents(["bb", "ccc"]), [[2.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(inner.calls, 3)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+class TestIncrementalIndexer(unittest.TestCase):
+    class Embedder:
+        def __init__(self):
+            self.calls = 0
+
+        def embed_documents(self, texts):
+            self.calls += len(texts)
+            return [[1.0, float(len(text)), 0.5] for text in texts]
+
+    def write_policies(self, texts):
+        with open(os.path.join(self.source_dir, "policies.json"), "w", encoding="utf-8") as f:
+            json.dump([{"text": text, "product_id": f"PROD-00{i}"} for i, text in enumerate(texts)], f)
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        self.embedder = self.Embedder()
+        self.store = InMemoryVectorStore(embeddings=self.embedder)
+        self.keyword_index = BM25Index()
+        self.indexer = IncrementalIndexer(self.source_dir, [self.store, self.keyword_index])
+
+    def run_indexer(self):
+        manifest = IngestionManifest.load(self.manifest_path)
+        stats = self.indexer.run(manifest)
+        manifest.save()
+        return stats
+
+    def test_only_changed_chunks_are_reindexed(self):
+        self.write_policies(["Returns accepted within 30 days.", "Shipping takes 5 days."])
+        self.run_indexer()
+        self.assertEqual(self.embedder.calls, 2)
+        self.assertEqual(self.run_indexer()["files_changed"], 0)
+
+        self.write_policies(["Returns accepted within 60 days."])
+        os.utime(os.path.join(self.source_dir, "policies.json"), (0, 1))  # mtime granularity
+        stats = self.run_indexer()
+        self.assertEqual((stats["chunks_upserted"], stats["chunks_deleted"]), (1, 2))
+        self.assertEqual(self.embedder.calls, 3)
+        self.assertEqual(self.store.texts, ["Returns accepted within 60 days."])
+        self.assertEqual(self.keyword_index.query("shipping"), [])
+
+        os.remove(os.path.join(self.source_dir, "policies.json"))
+        self.assertEqual(self.run_indexer()["files_removed"], 1)
+        self.assertEqual((len(self.store), len(self.keyword_index)), (0, 0))
+
+    def test_plan_keeps_referenced_ids(self):
+        chunks = [{"id": "a"}, {"id": "c"}]
+        upserts, stale, unchanged = IncrementalIndexer.plan(chunks, ["a", "b", "d"], kept_ids=["d"])
+        self.assertEqual(([chunk["id"] for chunk in upserts], stale, unchanged), (["c"], ["b"], 2))
+
+class TestIngestionPipeline(unittest.TestCase):
+    def test_indexes_files_and_resumes_from_manifest(self):
+        source_dir = tempfile.mkdtemp()
+        for i in range(5):
+            with open(os.path.join(source_dir, f"policy{i}.json"), "w", encoding="utf-8") as f:
+                json.dump([{"text": f"Policy {i} section {j}.", "product_id": f"PROD-00{i}"} for j in range(2)], f)
+        manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        embedder = TestIncrementalIndexer.Embedder()
+        store, keyword_index = InMemoryVectorStore(), BM25Index()
+
+        report = IngestionPipeline(source_dir, [store, keyword_index], embedder, IngestionManifest.load(manifest_path),
+                                   checkpoint_every=2, embed_batch_size=3, report_seconds=0).run()
+        self.assertEqual((report["files"], report["chunks_upserted"], report["checkpoints"]), (5, 10, 3))
+        self.assertEqual((len(store), len(keyword_index), embedder.calls), (10, 10, 10))
+        self.assertEqual(store.query([1.0, 17.0, 0.5], top_k=1, filter={"product_id": "PROD-003"})[0]["metadata"]["source"], "policy3.json")
+
+        rerun = IngestionPipeline(source_dir, [store, keyword_index], embedder, IngestionManifest.load(manifest_path)).run()
+        self.assertEqual((rerun["files_total"], embedder.calls), (0, 10))
+
+    def test_cli_writes_ivf_partition(self):
+        from rag.ingestion.pipeline import main
+        from rag.retrieval.embedding_cache import CachedEmbeddings
+        source_dir, out_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        with open(os.path.join(source_dir, "policies.json"), "w", encoding="utf-8") as f:
+            json.dump([{"text": "Policy " + "x" * i} for i in range(12)], f)
+        index_path = os.path.join(out_dir, "vectors")
+        argv = ["--source-dir", source_dir, "--index-path", index_path, "--ivf", "--ivf-nlist", "2",
+                "--ivf-min-train-size", "10", "--keyword-index-path", os.path.join(out_dir, "bm25"),
+                "--manifest", os.path.join(out_dir, "manifest.json")]
+        cached = lambda embeddings: CachedEmbeddings(embeddings, cache_path=os.path.join(out_dir, "embeddings.sqlite"))
+        with mock.patch("rag.retrieval.vector_store.default_embeddings", TestIncrementalIndexer.Embedder), \
+                mock.patch("rag.retrieval.embedding_cache.CachedEmbeddings", cached), mock.patch("builtins.print"):
+            main(argv)
+        store = IVFVectorStore.load(index_path)
+        self.assertTrue(os.path.exists(os.path.join(index_path, "ivf.npz")))
+        self.assertEqual((len(store), store.is_trained, store.nlist), (12, True, 2))
+
+    def test_near_duplicates_collapse_onto_one_chunk(self):
+        source_dir = tempfile.mkdtemp()
+        footer = "Standard delivery takes 5 to 7 business days and all orders over 50 dollars ship free of charge."
+        for i, suffix in enumerate(["", " ", " Terms apply."]):
+            with open(os.path.join(source_dir, f"policy{i}.json"), "w", encoding="utf-8") as f:
+                json.dump([{"text": f"Policy {i} covers returns."}, {"text": footer + suffix}], f)
+        manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        store, near_dedup = InMemoryVectorStore(), NearDuplicateFilter(threshold=0.7)
+        run = lambda: IngestionPipeline(source_dir, [store], TestIncrementalIndexer.Embedder(),
+                                        IngestionManifest.load(manifest_path), report_seconds=0, near_dedup=near_dedup).run()
+
+        report = run()
+        self.assertEqual((report["near_dedup"]["near_duplicates"], len(store)), (2, 4))
+        footers = [metadata for text, metadata in zip(store.texts, store.metadatas) if text.startswith("Standard")]
+        self.assertEqual(footers[0]["sources"], ["policy0.json", "policy1.json", "policy2.json"])
+
+        # The canonical chunk outlives the file it came from while other files still contain it
+        os.remove(os.path.join(source_dir, "policy0.json"))
+        run()
+        footers = [metadata for text, metadata in zip(store.texts, store.metadatas) if text.startswith("Standard")]
+        self.assertEqual((len(store), footers[0]["sources"]), (3, ["policy1.json", "policy2.json"]))
+
+class TestQueryCache(unittest.TestCase):
+    def test_normalized_queries_share_entries(self):
+        cache = QueryCache(max_entries=2)
+        calls = []
+        compute = lambda text: calls.append(text) or [float(len(text))]
+        cache.get_or_compute("embedding", "m", "Where is my order?", compute)
+        cache.get_or_compute("embedding", "m", "  where IS my order? ", compute)
+        self.assertEqual(len(calls), 1)
+        cache.get_or_compute("embedding", "other-model", "Where is my order?", compute)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.stats()["kinds"]["embedding"]["hits"], 1)
+
+    def test_entries_expire(self):
+        cache = QueryCache(ttl=0.0)
+        cache.set("hyde", "m", "return policy", "Returns are accepted within 30 days.")
+        self.assertIsNone(cache.get("hyde", "m", "return policy"))
+
+class TestConcurrentHyDE(unittest.TestCase):
+    class Embedder:
+        def embed_query(self, text):
+            return [0.0, 1.0] if text.startswith("Hypothetical") else [1.0, 0.0]
+
+    class SlowLLM:
+        def __init__(self, delay):
+            self.delay = delay
+            self.calls = 0
+
+        def invoke(self, prompt):
+            self.calls += 1
+            time.sleep(self.delay)
+            return type("Message", (), {"content": "Hypothetical answer"})()
+
+    def setUp(self):
+        self.store = InMemoryVectorStore()
+        self.store.add_documents([
+            {"id": "direct", "text": "Backpack", "embedding": [1.0, 0.0], "metadata": {}},
+            {"id": "hyde", "text": "Backpack specs", "embedding": [0.0, 1.0], "metadata": {}}
+        ])
+
+    def test_hyde_results_fused_when_in_time(self):
+        retriever = Retriever(self.store, self.Embedder(), hyde_llm=self.SlowLLM(0.0), hyde_timeout=5.0)
+        results = retriever.retrieve("backpack", top_k=2, use_hyde=True, concurrent_hyde=True)
+        self.assertEqual({r["id"] for r in results}, {"direct", "hyde"})
+        self.assertTrue(all("fusion_score" in r for r in results))
+
+    def test_direct_results_used_after_deadline(self):
+        retriever = Retriever(self.store, self.Embedder(), hyde_llm=self.SlowLLM(0.5), hyde_timeout=0.05)
+        results = retriever.retrieve("backpack", top_k=1, use_hyde=True, concurrent_hyde=True)
+        self.assertEqual(results[0]["id"], "direct")
+        self.assertNotIn("fusion_score", results[0])
+
+    def test_hyde_skipped_while_slots_are_busy(self):
+        llm = self.SlowLLM(0.5)
+        retriever = Retriever(self.store, self.Embedder(), hyde_llm=llm, hyde_timeout=0.05, max_pending_hyde=1,
+                              keyword_index=BM25Index())
+        retriever.keyword_index.add_documents([{"id": "direct", "text": "Backpack", "metadata": {}}])
+        retriever.retrieve("backpack", top_k=1, use_hyde=True, concurrent_hyde=True)
+        start = time.perf_counter()
+        results = retriever.retrieve("backpack", top_k=1, use_hyde=True, concurrent_hyde=True)
+        self.assertLess(time.perf_counter() - start, 0.3)  # keyword search does not queue behind the late HyDE call
+        self.assertEqual((results[0]["id"], llm.calls), ("direct", 1))
+
+    def test_aretrieve_matches_retrieve(self):
+        retriever = Retriever(self.store, self.Embedder(), hyde_llm=self.SlowLLM(0.0), hyde_timeout=5.0)
+        results = asyncio.run(retriever.aretrieve("backpack", top_k=2, use_hyde=True))
+        expected = retriever.retrieve("backpack", top_k=2, use_hyde=True, concurrent_hyde=True)
+        self.assertEqual([r["id"] for r in results], [r["id"] for r in expected])
+        slow = Retriever(self.store, self.Embedder(), hyde_llm=self.SlowLLM(0.5), hyde_timeout=0.05)
+        self.assertEqual(asyncio.run(slow.aretrieve("backpack", top_k=1, use_hyde=True))[0]["id"], "direct")
+
+    def test_late_hyde_failure_is_not_left_unretrieved(self):
+        class FailingLLM(self.SlowLLM):
+            def invoke(self, prompt):
+                time.sleep(self.delay)
+                raise ConnectionError("LLM unavailable")
+        retriever = Retriever(self.store, self.Embedder(), hyde_llm=FailingLLM(0.2), hyde_timeout=0.05)
+        async def scenario():
+            errors = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context["message"]))
+            results = await retriever.aretrieve("backpack", top_k=1, use_hyde=True)
+            await asyncio.sleep(0.4)  # the abandoned HyDE task fails and is collected
+            gc.collect()
+            return results, errors
+        results, errors = asyncio.run(scenario())
+        self.assertEqual((results[0]["id"], errors), ("direct", []))
+
 class TestRetriever(unittest.TestCase):
     def setUp(self):
         # Create dummy chunks with embeddings
@@ -58,5 +684,208 @@ class TestRetriever(unittest.TestCase):
         results = retriever.retrieve("Backpack", top_k=1, use_hyde=True)
         self.assertEqual(len(results), 1)
 
+class TestRAGAugmenter(unittest.TestCase):
+    def test_packs_context_into_token_budget(self):
+        docs = [
+            {"text": "Returns are accepted within 30 days of delivery.", "score": 0.6, "metadata": {"source": "returns.json"}},
+            {"text": "Laptops have a two year warranty. Batteries are covered for one year.", "score": 0.9, "metadata": {"source": "warranty.pdf"}},
+            {"text": "Returns are accepted within 30 days of delivery!", "score": 0.5, "metadata": {"source": "faq.json"}},
+            {"text": "Gift cards never expire. " + "They can be used online or in any of our stores. " * 20, "score": 0.1, "metadata": {"source": "cards.csv"}}
+        ]
+        augmenter = RAGAugmenter(max_context_tokens=80)
+        metadata = augmenter.augment("Can I return shoes?", docs)["metadata"]
+        self.assertEqual([s["source"] for s in metadata["sources"]], ["warranty.pdf", "returns.json", "cards.csv"])
+        self.assertEqual((metadata["docs_deduplicated"], metadata["docs_truncated"]), (1, 1))
+        self.assertLessEqual(metadata["context_tokens"], 80)
+        prompt = augmenter.augment("Can I return shoes?", docs)["prompt"]
+        self.assertIn("Gift cards never expire.", prompt)
+        self.assertIn("stores.\n", prompt)  # cut after a whole sentence
+        self.assertLess(prompt.count("They can be used"), 20)
+
+class TestExtractiveCompressor(unittest.TestCase):
+    def test_keeps_relevant_sentences_with_sources(self):
+        docs = [
+            {"id": "a", "text": "Our store opened in 1998. Returns are accepted within 30 days.\nShoes must be unworn.", "score": 0.8, "metadata": {"source": "returns.json"}},
+            {"id": "b", "text": "Laptops carry a two year warranty. Batteries are covered for one year.", "score": 0.7, "metadata": {"source": "warranty.pdf"}}
+        ]
+        compressed, stats = ExtractiveCompressor(max_sentences=2).compress("How many days for returns of shoes?", docs)
+        self.assertEqual([(d["id"], d["metadata"]["source"]) for d in compressed], [("a", "returns.json")])
+        self.assertEqual(compressed[0]["text"], "Returns are accepted within 30 days. Shoes must be unworn.")
+        self.assertEqual((stats["sentences_in"], stats["sentences_kept"]), (5, 2))
+        self.assertLess(stats["compression_ratio"], 0.5)
+
+class TestSemanticAnswerCache(unittest.TestCase):
+    def test_serves_similar_queries_until_index_changes(self):
+        version = ["v1"]
+        cache = SemanticAnswerCache(threshold=0.9, dimensions=None, version_fn=lambda: version[0])
+        answer = {"answer": "30 days.", "sources": [{"source": "returns.json"}], "confidence": 0.8, "tool_calls": [],
+                  "retrieved_docs": [{"text": "Returns are accepted within 30 days."}]}
+        self.assertTrue(cache.store([1.0, 0.0, 0.1], answer, min_confidence=0.6))
+        self.assertFalse(cache.store([0.0, 1.0, 0.0], {**answer, "tool_calls": [{"tool": "get_order_status"}]}))
+        self.assertFalse(cache.store([0.0, 0.0, 1.0], {**answer, "confidence": 0.3}, min_confidence=0.6))
+
+        hit = cache.lookup([0.95, 0.05, 0.1])
+        self.assertEqual(hit["answer"], "30 days.")
+        self.assertNotIn("retrieved_docs", hit)
+        self.assertIsNone(cache.lookup([0.0, 0.0, 1.0]))
+        self.assertIsNone(cache.lookup([0.0, 1.0, 0.0]))
+        self.assertIsNone(cache.lookup([1.0, 0.0, 0.1], filter={"product_id": "PROD-001"}))
+        self.assertEqual(cache.stats()["hits"], 1)
+
+        version[0] = "v2"
+        self.assertIsNone(cache.lookup([1.0, 0.0, 0.1]))
+        self.assertEqual((cache.stats()["entries"], cache.stats()["invalidations"]), (0, 1))
+
+class TestStreamingGeneration(unittest.TestCase):
+    def setUp(self):
+        from rag.generation.generator import RAGGenerator
+        from rag.agents.tools.tool_registry import TOOL_REGISTRY, Tool
+        TOOL_REGISTRY["lookup_stock"] = Tool("lookup_stock", lambda sku: {"sku": sku, "stock": 3}, "Stock by SKU.", {})
+        self.addCleanup(TOOL_REGISTRY.pop, "lookup_stock")
+        with placeholder_api_key():
+            self.generator = RAGGenerator()
+
+    def test_tool_call_fragments_are_reassembled_by_index(self):
+        self.generator.client = FakeChatClient([
+            iter([
+                stream_chunk("Let me check. "),
+                stream_chunk(tool_calls=[tool_call_delta(0, "call_a", "lookup_", '{"sku": ')]),
+                stream_chunk(tool_calls=[tool_call_delta(1, "call_b", "lookup_stock", '{"sku": "B"}')]),
+                stream_chunk(tool_calls=[tool_call_delta(0, name="stock", arguments='"A"}')]),
+                SimpleNamespace(choices=[])
+            ]),
+            iter([stream_chunk("Both are "), stream_chunk("in stock.")])
+        ])
+        messages = [{"role": "user", "content": "Are A and B in stock?"}]
+        events = list(self.generator.generate_stream(messages))
+
+        self.assertEqual([e["type"] for e in events], ["token", "tool_call", "tool_call", "token", "token", "done"])
+        self.assertEqual([e["input"] for e in events if e["type"] == "tool_call"], [{"sku": "A"}, {"sku": "B"}])
+        self.assertEqual(events[-1]["response"], "Both are in stock.")
+        self.assertNotIn("error", events[-1])
+        assistant = [m for m in messages if m["role"] == "assistant"]
+        self.assertEqual(len(assistant), 1)
+        self.assertEqual([c["id"] for c in assistant[0]["tool_calls"]], ["call_a", "call_b"])
+        self.assertEqual(assistant[0]["tool_calls"][0]["function"], {"name": "lookup_stock", "arguments": '{"sku": "A"}'})
+        self.assertEqual([m["tool_call_id"] for m in messages if m["role"] == "tool"], ["call_a", "call_b"])
+
+    def test_failure_ends_with_error_done_event(self):
+        def broken_stream():
+            yield stream_chunk("Partial")
+            raise ConnectionError("stream reset")
+        self.generator.client = FakeChatClient([broken_stream()])
+        events = list(self.generator.generate_stream([{"role": "user", "content": "?"}]))
+        self.assertEqual([e["type"] for e in events], ["token", "done"])
+        self.assertEqual(events[-1]["response"], "Partial")
+        self.assertEqual(events[-1]["error"], "stream reset")
+
+    def test_unknown_tool_becomes_error_result(self):
+        self.generator.client = FakeChatClient([
+            iter([stream_chunk(tool_calls=[tool_call_delta(0, "c", "missing_tool", "{}")])]),
+            iter([stream_chunk("No such tool.")])
+        ])
+        events = list(self.generator.generate_stream([{"role": "user", "content": "?"}]))
+        self.assertEqual([e["type"] for e in events], ["tool_call", "token", "done"])
+        self.assertIn("unknown tool", events[0]["output"]["error"])
+        self.assertNotIn("error", events[-1])
+
+    def test_sse_route_frames_controller_events(self):
+        flask_app = import_flask_app()
+        routes = sys.modules["app.routes"]
+        def query_stream(query, filter=None):
+            yield {"type": "token", "content": "30 days."}
+            yield {"type": "done", "answer": "30 days.", "sources": [], "confidence": 0.9}
+            raise RuntimeError("connection lost")
+        with mock.patch.object(routes, "rag_controller", SimpleNamespace(query_stream=query_stream)):
+            response = flask_app.app.test_client().post("/api/rag/query/stream", json={"query": "returns?"})
+            body = response.get_data(as_text=True)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(body.split("\n\n")[:3], [
+            'event: token\ndata: {"content": "30 days."}',
+            'event: done\ndata: {"answer": "30 days.", "sources": [], "confidence": 0.9}',
+            'event: error\ndata: {"error": "connection lost"}'
+        ])
+        self.assertEqual(flask_app.app.test_client().post("/api/rag/query/stream", json={}).status_code, 400)
+
+class TestAsyncGeneration(unittest.TestCase):
+    def setUp(self):
+        from rag.generation.generator import AsyncRAGGenerator
+        from rag.agents.tools.tool_registry import TOOL_REGISTRY, Tool
+        async def slow_stock(sku):
+            await asyncio.sleep(0.3)
+            return {"sku": sku, "stock": 3}
+        async def hang(sku):
+            await asyncio.sleep(5)
+        def broken(sku):
+            raise ConnectionError("inventory service down")
+        for tool in (Tool("slow_stock", slow_stock, "", {}), Tool("hang", hang, "", {}, timeout=0.1), Tool("broken", broken, "", {})):
+            TOOL_REGISTRY[tool.name] = tool
+            self.addCleanup(TOOL_REGISTRY.pop, tool.name)
+        with placeholder_api_key():
+            self.generator = AsyncRAGGenerator()
+
+    def completion(self, content=None, calls=()):
+        tool_calls = [SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name=name, arguments=json.dumps({"sku": sku})))
+                      for i, (name, sku) in enumerate(calls)]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=tool_calls or None))])
+
+    def run_generator(self, calls):
+        client = FakeChatClient([self.completion(calls=calls), self.completion("Done.")])
+        async def create(**kwargs):  # AsyncOpenAI's create is a coroutine
+            return client.create(**kwargs)
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        messages = [{"role": "user", "content": "?"}]
+        return asyncio.run(self.generator.generate(messages)), messages
+
+    def test_tool_calls_run_concurrently(self):
+        start = time.perf_counter()
+        result, messages = self.run_generator([("slow_stock", "A"), ("slow_stock", "B"), ("slow_stock", "C")])
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 0.6)  # ~max of the calls (0.3 s), not their sum (0.9 s)
+        self.assertEqual(result["response"], "Done.")
+        self.assertEqual([r["output"]["sku"] for r in result["tool_calls"]], ["A", "B", "C"])
+        self.assertEqual([m["tool_call_id"] for m in messages if isinstance(m, dict) and m["role"] == "tool"],
+                         ["call_0", "call_1", "call_2"])
+
+    def test_failed_tools_become_error_results(self):
+        result, _ = self.run_generator([("hang", "A"), ("broken", "B"), ("no_such_tool", "C"), ("slow_stock", "D")])
+        outputs = [r["output"] for r in result["tool_calls"]]
+        self.assertEqual(outputs[0], {"error": "hang timed out after 0.1s"})
+        self.assertIn("inventory service down", outputs[1]["error"])
+        self.assertIn("unknown tool", outputs[2]["error"])
+        self.assertEqual(outputs[3], {"sku": "D", "stock": 3})
+        self.assertEqual(result["response"], "Done.")
+
+class TestAgenticRAGController(unittest.TestCase):
+    class Retriever:
+        def retrieve(self, query, **kwargs):
+            return [{"text": f"context for {query}"}]
+
+        async def aretrieve(self, query, **kwargs):
+            return self.retrieve(query)
+
+    class Augmenter:
+        def augment(self, query, docs):
+            return {"prompt": query, "metadata": {"confidence": 0.9, "sources": ["faq.json"], "context_tokens": 3}}
+
+    def setUp(self):
+        from rag.agents.agentic_controller import AgenticRAGController
+        with placeholder_api_key():
+            self.controller = AgenticRAGController(self.Retriever(), augmenter=self.Augmenter())
+        self.results = [{"response": None, "tool_calls": [{"tool": "check_product_stock", "input": {}, "output": {"stock": 3}}]},
+                        {"response": "In stock.", "tool_calls": []}]
+
+    def test_sync_and_async_queries_run_the_same_hops(self):
+        results = list(self.results)
+        self.controller.generator = SimpleNamespace(generate=lambda messages, use_tools: results.pop(0))
+        sync = self.controller.query("Is it in stock?")
+        results = list(self.results)
+        async def generate(messages, use_tools):
+            return results.pop(0)
+        self.controller.async_generator = SimpleNamespace(generate=generate)
+        self.assertEqual(asyncio.run(self.controller.aquery("Is it in stock?")), sync)
+        self.assertEqual((sync["answer"], sync["hops"], sync["sources"]), ("In stock.", 2, ["faq.json"]))
+        self.assertEqual(sync["retrieved_docs"], [{"text": "context for Using tool result: {'stock': 3}, answer: Is it in stock?"}])
+
 if __name__ == "__main__":
     unittest.main()